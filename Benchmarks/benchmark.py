@@ -0,0 +1,277 @@
+
+# This file times the hot paths of the project on generated data and compares them with a stored baseline
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.abspath(os.path.join(base_dir, ".."))
+numscan_dir = os.path.join(project_dir, "Numscan")
+script_dir = os.path.join(numscan_dir, "Scripts")
+numscan2_dir = os.path.join(project_dir, "Numscan 2")
+
+for path in (os.path.join(script_dir, "Train"), os.path.join(script_dir, "Test"), script_dir, numscan_dir, project_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import load
+import predict
+import train
+from network import NeuralNetworkStorage, nn
+from Numscan.Scripts.serving import preprocess_bytes
+
+results_path = os.path.join(base_dir, "results.json")
+baseline_path = os.path.join(base_dir, "baseline.json")
+
+BENCHMARKS = []
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+    return register
+
+# Runs fn until min_time has passed, several times, and returns the best seconds per call
+def timeit(fn, min_time=0.2, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+class Workspace:
+    def __init__(self, images_per_class=100, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.dir = tempfile.mkdtemp(prefix="numscan-bench-")
+        self.model = NeuralNetworkStorage(784, 128, 128, 10)
+        self.model_pickle = os.path.join(self.dir, "model.pickle")
+        self.model_json = os.path.join(self.dir, "model.json")
+        self.model.save_to_pickle(self.model_pickle)
+        self.model.save_to_json(self.model_json)
+
+        self.X = self.rng.random((256, 784), dtype=np.float32)
+        self.labels = self.rng.integers(0, 10, 256)
+        self.vector = self.X[0].tolist()
+
+        self.data_dir = os.path.join(self.dir, "mnist-png")
+        for label in range(10):
+            class_dir = os.path.join(self.data_dir, "train", str(label))
+            os.makedirs(class_dir)
+            for i in range(images_per_class):
+                pixels = self.rng.integers(0, 256, (28, 28), dtype=np.uint8)
+                Image.fromarray(pixels).save(os.path.join(class_dir, f"{i}.png"))
+
+        buffer = io.BytesIO()
+        Image.fromarray(self.rng.integers(0, 256, (280, 280), dtype=np.uint8)).save(buffer, format="PNG")
+        self.png = buffer.getvalue()
+
+    def use_model(self, numpy_storage):
+        nn.load_from_pickle(self.model_pickle)
+        if numpy_storage:
+            nn.to_numpy(copy=True)
+        else:
+            nn.to_lists()
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+@benchmark("predict.mm")
+def bench_mm(ws):
+    ws.use_model(False)
+    weights = nn.get_weights(0)
+    return timeit(lambda: predict.mm(weights, ws.vector))
+
+@benchmark("predict.exec (lists)")
+def bench_exec_lists(ws):
+    ws.use_model(False)
+    return timeit(lambda: predict.exec(ws.vector))
+
+@benchmark("predict.exec (numpy)")
+def bench_exec_numpy(ws):
+    ws.use_model(True)
+    return timeit(lambda: predict.exec(ws.vector))
+
+@benchmark("predict.feed_forward (numpy)")
+def bench_feed_forward(ws):
+    ws.use_model(True)
+    return timeit(lambda: predict.feed_forward(ws.vector))
+
+@benchmark("predict.predict_batch (256 images)")
+def bench_predict_batch(ws):
+    ws.use_model(True)
+    return timeit(lambda: predict.predict_batch(ws.X))
+
+@benchmark("train.back_propagation (1 sample)")
+def bench_back_propagation(ws):
+    ws.use_model(False)
+    return timeit(lambda: train.back_propagation(ws.vector, 3), min_time=0.5, repeats=1)
+
+@benchmark("train.back_propagation_batch (32 samples)")
+def bench_back_propagation_batch(ws):
+    ws.use_model(True)
+    return timeit(lambda: train.back_propagation_batch(ws.X[:32], ws.labels[:32]))
+
+@benchmark("load.load_dataset (decode)")
+def bench_load_decode(ws):
+    load.data_dir = ws.data_dir
+
+    def run():
+        load.cache_dir = tempfile.mkdtemp(dir=ws.dir)
+        load.load_dataset("train", workers=1)
+    return timeit(run, min_time=0, repeats=1)
+
+@benchmark("load.load_dataset (cached)")
+def bench_load_cached(ws):
+    load.data_dir = ws.data_dir
+    load.cache_dir = os.path.join(ws.dir, "cache")
+    load.load_dataset("train", workers=1)
+    return timeit(lambda: load.load_dataset("train"))
+
+@benchmark("load.load_trainings_data (cached)")
+def bench_load_trainings_data(ws):
+    load.data_dir = ws.data_dir
+    load.cache_dir = os.path.join(ws.dir, "cache")
+    return timeit(load.load_trainings_data)
+
+@benchmark("load.load_index (cached) + random sample")
+def bench_load_index(ws):
+    load.data_dir = ws.data_dir
+    load.cache_dir = os.path.join(ws.dir, "cache")
+    load.load_index("train", workers=1)
+
+    def run():
+        index = load.load_index("train")
+        index.pixels(index.random_row(label=3))
+    return timeit(run)
+
+@benchmark("network.load_from_pickle")
+def bench_load_pickle(ws):
+    storage = NeuralNetworkStorage()
+    return timeit(lambda: storage.load_from_pickle(ws.model_pickle))
+
+@benchmark("network.load_from_json")
+def bench_load_json(ws):
+    storage = NeuralNetworkStorage()
+    return timeit(lambda: storage.load_from_json(ws.model_json))
+
+@benchmark("serving.preprocess_bytes")
+def bench_preprocess_bytes(ws):
+    return timeit(lambda: preprocess_bytes(ws.png))
+
+@benchmark("Numscan 2 predict (keras, 1 image)")
+def bench_numscan2(ws):
+    if importlib.util.find_spec("tensorflow") is None:
+        return None
+    spec = importlib.util.spec_from_file_location("numscan2_model", os.path.join(numscan2_dir, "model.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    model = module.build_model()
+    batch = ws.X[:1].reshape(1, 28, 28, 1)
+    return timeit(lambda: model.predict(batch, verbose=0))
+
+@benchmark("Numscan 2 predict (numpy engine, 1 image)")
+def bench_numscan2_engine(ws):
+    spec = importlib.util.spec_from_file_location("numscan2_engine", os.path.join(numscan2_dir, "engine.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    rng = np.random.default_rng(0)
+    engine = module.CnnEngine([rng.standard_normal(shape, dtype=np.float32) * 0.1 for shape in module.WEIGHT_SHAPES])
+    batch = ws.X[:1].reshape(1, 28, 28, 1)
+    return timeit(lambda: engine.predict(batch))
+
+@benchmark("Numscan 2 predict (numpy engine, 256 images)")
+def bench_numscan2_engine_batch(ws):
+    spec = importlib.util.spec_from_file_location("numscan2_engine", os.path.join(numscan2_dir, "engine.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    rng = np.random.default_rng(0)
+    engine = module.CnnEngine([rng.standard_normal(shape, dtype=np.float32) * 0.1 for shape in module.WEIGHT_SHAPES])
+    batch = ws.X.reshape(-1, 28, 28, 1)
+    return timeit(lambda: engine.predict(batch))
+
+def run(selected=None):
+    ws = Workspace()
+    # Silences the progress output of the loader and the per-sample training print
+    stdout, stderr = sys.stdout, sys.stderr
+    results = {}
+    try:
+        for name, fn in BENCHMARKS:
+            if selected and not any(part in name for part in selected):
+                continue
+            sys.stdout = sys.stderr = io.StringIO()
+            try:
+                seconds = fn(ws)
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+            results[name] = seconds
+            print(f"{name:45} {'skipped' if seconds is None else f'{seconds * 1000:10.3f} ms'}")
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        ws.close()
+    return results
+
+# Returns the benchmarks that got slower than the baseline by more than threshold
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if seconds is None or not before:
+            continue
+        ratio = seconds / before
+        marker = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:45} {ratio:6.2f}x {marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Numscan hot paths")
+    parser.add_argument("--output", default=results_path, help="JSON file for the results")
+    parser.add_argument("--baseline", default=baseline_path, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before a regression is flagged")
+    parser.add_argument("--only", nargs="*", help="run only benchmarks whose name contains one of these")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args.only)
+
+    data = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Saved {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(data, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        print("Compared with baseline")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -1,104 +1,174 @@
 ﻿
 # This file runs a script for a discord application
 
-import io
+import asyncio
+import hashlib
 import logging
 import os
 import sys
-from typing import List, Tuple
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import List, Optional, Set, Tuple
 
 import discord
-from dotenv import dotenv_values
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
-NUMSCAN_DIR = os.path.join(PROJECT_DIR, "Numscan")
 if PROJECT_DIR not in sys.path:
     sys.path.insert(0, PROJECT_DIR)
-if NUMSCAN_DIR not in sys.path:
-    sys.path.insert(0, NUMSCAN_DIR)
 
-from network import nn
-import Numscan.Scripts.Test.predict as predict
+from Numscan.Scripts.serving import (
+    create_executor,
+    load_env,
+    load_model,
+    model_candidates,
+    predict_digits,
+    preprocess_bytes,
+    resolve_model_path,
+    shutdown_executor,
+)
 
-DOTENV_CANDIDATES = [
-    os.path.join(PROJECT_DIR, ".env"),
-    os.path.join(BASE_DIR, ".env"),
-]
-
-
-def load_env_file(dotenv_path: str) -> None:
-    with open(dotenv_path, "r", encoding="utf-8-sig") as handle:
-        values = dotenv_values(stream=handle)
-    for key, value in values.items():
-        if value is None:
-            continue
-        os.environ[key] = value
-
-
-for dotenv_path in DOTENV_CANDIDATES:
-    if os.path.exists(dotenv_path):
-        load_env_file(dotenv_path)
+load_env()
 
 ENV_MODEL_PATH = os.getenv("MNIST_MODEL_PATH")
-MODEL_CANDIDATES = [
-    ENV_MODEL_PATH,
-    os.path.join(NUMSCAN_DIR, "Models", "after.pickle"),
-    os.path.join(PROJECT_DIR, "Numscan 2", "Models", "model.pkl"),
-]
+MODEL_CANDIDATES = model_candidates()
 TARGET_CHANNEL = os.getenv("MNIST_CHANNEL_NAME", "numscan")
+EXECUTOR_KIND = os.getenv("MNIST_EXECUTOR", "thread").lower()
+EXECUTOR_WORKERS = int(os.getenv("MNIST_WORKERS", "0")) or None
+BATCH_SIZE = int(os.getenv("MNIST_BATCH_SIZE", "32"))
+BATCH_WAIT_MS = float(os.getenv("MNIST_BATCH_WAIT_MS", "5"))
+CACHE_SIZE = int(os.getenv("MNIST_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("MNIST_CACHE_TTL", "3600"))
+CACHE_LOG_EVERY = 100
+NORMALIZE = os.getenv("MNIST_NORMALIZE", "0").lower() in ("1", "true", "yes")
 ALLOWED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
-EXPECTED_SIZE = (28, 28)
-
-try:
-    RESAMPLE_MODE = Image.Resampling.LANCZOS
-except AttributeError:
-    RESAMPLE_MODE = Image.ANTIALIAS
-
-
-def load_model(model_path: str) -> None:
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model file '{model_path}' not found.")
-    nn.load_from_pickle(model_path)
-    logging.info("Loaded model parameters from %s", model_path)
-
-
-def resolve_model_path(candidates: List[str]) -> str:
-    for candidate in candidates:
-        if candidate and os.path.exists(candidate):
-            return candidate
-    missing_list = ", ".join(path for path in candidates if path)
-    raise FileNotFoundError(f"Model file not found. Checked: {missing_list}")
 
 
-def preprocess_image(image: Image.Image) -> List[float]:
-    grayscale = image.convert("L")
-    resized = grayscale.resize(EXPECTED_SIZE, RESAMPLE_MODE)
-    pixels = [pixel / 255.0 for pixel in resized.getdata()]
-    if len(pixels) != EXPECTED_SIZE[0] * EXPECTED_SIZE[1]:
-        raise ValueError("Unexpected pixel count after preprocessing.")
-    return pixels
-
-
-def preprocess_bytes(data: bytes) -> List[float]:
-    with Image.open(io.BytesIO(data)) as img:
-        return preprocess_image(img)
-
-
-def predict_digit(vector: List[float]) -> Tuple[int, float]:
-    _, layer_outputs = predict.exec(vector)
-    logits = layer_outputs[-1]
-    probabilities = predict.soft_max(logits)
-    digit = max(range(len(probabilities)), key=lambda idx: probabilities[idx])
-    confidence = probabilities[digit]
-    return digit, confidence
+# LRU cache of predictions keyed by the model checksum and a hash of the attachment bytes
+class PredictionCache:
+    def __init__(self, max_size: int, ttl: float, checksum: str):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.checksum = checksum
+        self.entries: "OrderedDict[str, Tuple[float, Tuple[int, float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, data: bytes) -> str:
+        return f"{self.checksum}:{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Tuple[int, float]]:
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        if (self.hits + self.misses) % CACHE_LOG_EVERY == 0:
+            logging.info("Prediction cache: %d hits, %d misses, %d entries", self.hits, self.misses, len(self.entries))
+        return None if entry is None else entry[1]
+
+    def put(self, key: str, value: Tuple[int, float]) -> None:
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+# Collects pending images for up to max_batch items or max_wait_ms and predicts them in one forward pass
+class InferenceBatcher:
+    def __init__(self, executor: Executor, max_batch: int, max_wait_ms: float):
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.batches: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._collect())
+
+    async def predict(self, vector: List[float]) -> Tuple[int, float]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((vector, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        getter: Optional[asyncio.Future] = None
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(self.queue.get())
+            items = [await getter]
+            getter = None
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # The get is never cancelled: when the window closes first it stays pending and opens the next batch,
+                # so an item that arrives right at the deadline can't be lost
+                getter = asyncio.ensure_future(self.queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    break
+                items.append(getter.result())
+                getter = None
+            self._dispatch(items)
+
+    # Dispatched as its own task, so the next batch can be collected while this one runs.
+    # The loop only keeps weak references to tasks, the set keeps running batches alive
+    def _dispatch(self, items: List[Tuple[List[float], asyncio.Future]]) -> None:
+        task = asyncio.create_task(self._run_batch(items))
+        self.batches.add(task)
+        task.add_done_callback(self.batches.discard)
+
+    async def _run_batch(self, items: List[Tuple[List[float], asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, predict_digits, [vector for vector, _ in items])
+        except Exception as exc:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        logging.debug("Predicted a batch of %d images", len(items))
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
 
 
 class NumscanClient(discord.Client):
-    def __init__(self, *, target_channel: str, **options):
+    def __init__(
+        self,
+        *,
+        target_channel: str,
+        executor: Executor,
+        batcher: InferenceBatcher,
+        cache: PredictionCache,
+        **options,
+    ):
         super().__init__(**options)
         self.target_channel = target_channel.lower()
+        self.executor = executor
+        self.batcher = batcher
+        self.cache = cache
+
+    async def setup_hook(self) -> None:
+        self.batcher.start()
 
     async def on_ready(self) -> None:
         if self.user:
@@ -106,6 +176,26 @@ class NumscanClient(discord.Client):
         else:
             logging.info("Connected to Discord.")
 
+    async def process_attachment(self, message: discord.Message, attachment: discord.Attachment) -> str:
+        try:
+            logging.info("Processing attachment %s from %s", attachment.filename, message.author)
+            payload = await attachment.read()
+            key = self.cache.key(payload)
+            cached = self.cache.get(key)
+            if cached is not None:
+                digit, confidence = cached
+            else:
+                loop = asyncio.get_running_loop()
+                pixels = await loop.run_in_executor(self.executor, preprocess_bytes, payload, NORMALIZE)
+                digit, confidence = await self.batcher.predict(pixels)
+                self.cache.put(key, (digit, confidence))
+            return f"{attachment.filename}: {digit} ({confidence * 100:.1f}% confidence)"
+        except (UnidentifiedImageError, OSError):
+            return f"{attachment.filename}: could not read image data."
+        except Exception as exc:
+            logging.exception("Prediction failed for %s", attachment.filename)
+            return f"{attachment.filename}: prediction failed ({exc})."
+
     async def on_message(self, message: discord.Message) -> None:
         if message.author.bot:
             return
@@ -119,21 +209,9 @@ class NumscanClient(discord.Client):
         ]
         if not relevant_attachments:
             return
-        responses = []
-        for attachment in relevant_attachments:
-            try:
-                logging.info("Processing attachment %s from %s", attachment.filename, message.author)
-                payload = await attachment.read()
-                pixels = preprocess_bytes(payload)
-                digit, confidence = predict_digit(pixels)
-                responses.append(
-                    f"{attachment.filename}: {digit} ({confidence * 100:.1f}% confidence)"
-                )
-            except (UnidentifiedImageError, OSError):
-                responses.append(f"{attachment.filename}: could not read image data.")
-            except Exception as exc:
-                logging.exception("Prediction failed for %s", attachment.filename)
-                responses.append(f"{attachment.filename}: prediction failed ({exc}).")
+        responses = await asyncio.gather(
+            *(self.process_attachment(message, attachment) for attachment in relevant_attachments)
+        )
         if responses:
             reply_body = "Predictions:\n" + "\n".join(f"- {line}" for line in responses)
             await message.reply(reply_body, mention_author=False)
@@ -144,15 +222,27 @@ def main() -> None:
     if ENV_MODEL_PATH and not os.path.exists(ENV_MODEL_PATH):
         logging.warning("MNIST_MODEL_PATH is set but missing: %s", ENV_MODEL_PATH)
     model_path = resolve_model_path(MODEL_CANDIDATES)
-    load_model(model_path)
+    checksum = load_model(model_path)
     token = os.getenv("DISCORD_BOT_TOKEN")
     if not token:
         raise RuntimeError("Please set the DISCORD_BOT_TOKEN environment variable.")
     intents = discord.Intents.default()
     intents.message_content = True
     intents.messages = True
-    client = NumscanClient(intents=intents, target_channel=TARGET_CHANNEL)
-    client.run(token)
+    executor = create_executor(EXECUTOR_KIND, EXECUTOR_WORKERS, model_path)
+    batcher = InferenceBatcher(executor, BATCH_SIZE, BATCH_WAIT_MS)
+    cache = PredictionCache(CACHE_SIZE, CACHE_TTL, checksum)
+    client = NumscanClient(
+        intents=intents,
+        target_channel=TARGET_CHANNEL,
+        executor=executor,
+        batcher=batcher,
+        cache=cache,
+    )
+    try:
+        client.run(token)
+    finally:
+        shutdown_executor(executor)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,273 @@
+
+# This file runs a local HTTP server for Numscan predictions without Discord
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import Executor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import UnidentifiedImageError
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from Numscan.Scripts.serving import (
+    create_executor,
+    load_env,
+    load_model,
+    model_candidates,
+    predict_probabilities,
+    preprocess_bytes,
+    reload_model,
+    resolve_model_path,
+    shutdown_executor,
+)
+
+load_env()
+
+HOST = os.getenv("MNIST_HTTP_HOST", "127.0.0.1")
+PORT = int(os.getenv("MNIST_HTTP_PORT", "8080"))
+EXECUTOR_KIND = os.getenv("MNIST_EXECUTOR", "thread").lower()
+EXECUTOR_WORKERS = int(os.getenv("MNIST_WORKERS", "0")) or None
+MAX_BODY_SIZE = 16 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15.0
+PIXEL_COUNT = 28 * 28
+NORMALIZE = os.getenv("MNIST_NORMALIZE", "0").lower() in ("1", "true", "yes")
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def preprocess_many(images: List[bytes], normalize: bool = False) -> List[np.ndarray]:
+    return [preprocess_bytes(data, normalize) for data in images]
+
+
+def pixel_vectors(values) -> np.ndarray:
+    try:
+        vectors = np.asarray(values, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise HttpError(400, "Pixels must be arrays of numbers.")
+    if vectors.shape == (0,):
+        # An empty batch
+        return vectors.reshape(0, PIXEL_COUNT)
+    if vectors.ndim != 2 or vectors.shape[1] != PIXEL_COUNT:
+        raise HttpError(400, f"Expected arrays of {PIXEL_COUNT} floats.")
+    return vectors
+
+
+def prediction(probabilities: np.ndarray) -> Dict:
+    digit = int(probabilities.argmax())
+    return {
+        "digit": digit,
+        "confidence": float(probabilities[digit]),
+        "probabilities": [float(p) for p in probabilities],
+    }
+
+
+class NumscanServer:
+    def __init__(self, executor: Executor, model_path: str, checksum: str):
+        self.executor = executor
+        self.model_path = model_path
+        self.checksum = checksum
+        self.started = time.time()
+        self.requests = 0
+
+    async def run_in_pool(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def vectors_from_request(self, headers: Dict[str, str], body: bytes, batch: bool):
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            if batch:
+                raise HttpError(400, "Batch requests must be JSON.")
+            return await self.run_in_pool(preprocess_many, [body], NORMALIZE)
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "Invalid JSON body.")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Expected a JSON object.")
+
+        if batch and "images" in data:
+            try:
+                images = [base64.b64decode(image, validate=True) for image in data["images"]]
+            except (TypeError, ValueError):
+                raise HttpError(400, "Images must be base64 encoded.")
+            return await self.run_in_pool(preprocess_many, images, NORMALIZE)
+        if "pixels" in data:
+            pixels = data["pixels"] if batch else [data["pixels"]]
+            return pixel_vectors(pixels)
+        if not batch and "image" in data:
+            try:
+                image = base64.b64decode(data["image"], validate=True)
+            except (TypeError, ValueError):
+                raise HttpError(400, "Image must be base64 encoded.")
+            return await self.run_in_pool(preprocess_many, [image], NORMALIZE)
+        raise HttpError(400, "Expected 'pixels' or image data.")
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict]:
+        path = path.split("?")[0]
+        if path == "/health":
+            if method != "GET":
+                raise HttpError(405, "Use GET.")
+            return 200, {
+                "status": "ok",
+                "model": self.model_path,
+                "checksum": self.checksum,
+                "uptime": time.time() - self.started,
+                "requests": self.requests,
+            }
+        if path == "/reload":
+            if method != "POST":
+                raise HttpError(405, "Use POST.")
+            # Re-reads the model file and swaps it in for every worker at once
+            try:
+                self.checksum = reload_model(self.model_path)
+            except (RuntimeError, ValueError) as exc:
+                raise HttpError(409, str(exc))
+            return 200, {"status": "reloaded", "model": self.model_path, "checksum": self.checksum}
+        if path not in ("/predict", "/predict/batch"):
+            raise HttpError(404, f"Unknown path '{path}'.")
+        if method != "POST":
+            raise HttpError(405, "Use POST.")
+
+        batch = path == "/predict/batch"
+        try:
+            vectors = await self.vectors_from_request(headers, body, batch)
+        except (UnidentifiedImageError, OSError):
+            raise HttpError(400, "Could not read image data.")
+        if len(vectors) == 0:
+            return 200, {"predictions": []}
+
+        probabilities = await self.run_in_pool(predict_probabilities, vectors)
+        if batch:
+            return 200, {"predictions": [prediction(probs) for probs in probabilities]}
+        return 200, prediction(probabilities[0])
+
+    async def read_request(self, reader: asyncio.StreamReader):
+        request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line.")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "Chunked bodies are not supported, send Content-Length.")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length.")
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Body too large.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, version.upper(), headers, body
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, version, headers, body = request
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                    self.requests += 1
+                    status, payload = await self.handle(method, path, headers, body)
+                except HttpError as exc:
+                    status, payload = exc.status, {"error": str(exc)}
+                    keep_alive = keep_alive and exc.status < 500 and exc.status not in (411, 413)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as exc:
+                    logging.exception("Request failed")
+                    status, payload = 500, {"error": str(exc)}
+
+                response = json.dumps(payload).encode("utf-8")
+                head = (
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(response)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode("latin-1") + response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve(host: str, port: int, executor: Executor, model_path: str, checksum: str) -> None:
+    app = NumscanServer(executor, model_path, checksum)
+    server = await asyncio.start_server(app.serve_connection, host, port)
+    logging.info("Serving Numscan on http://%s:%d", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve Numscan predictions over HTTP")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--executor", choices=("thread", "process"), default=EXECUTOR_KIND)
+    parser.add_argument("--workers", type=int, default=EXECUTOR_WORKERS)
+    parser.add_argument("--model", help="model file, defaults to the same candidates as the Discord bot")
+    return parser.parse_args()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    args = parse_args()
+    model_path = args.model or resolve_model_path(model_candidates())
+    checksum = load_model(model_path)
+    executor = create_executor(args.executor, args.workers, model_path)
+    try:
+        asyncio.run(serve(args.host, args.port, executor, model_path, checksum))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_executor(executor)
+
+
+if __name__ == "__main__":
+    main()
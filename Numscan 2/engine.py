@@ -0,0 +1,162 @@
+
+# This file runs the Numscan 2 CNN from its pickled weights with NumPy only, without importing Tensorflow
+
+import argparse
+import os
+import pickle
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "Models", "model.pkl")
+
+# Weight shapes of build_model() in model.py, in the order of model.get_weights()
+WEIGHT_SHAPES = [
+    (3, 3, 1, 32), (32,),
+    (3, 3, 32, 64), (64,),
+    (1600, 64), (64,),
+    (64, 10), (10,),
+]
+
+# Valid 3x3 convolution as im2col followed by one matrix product, x is (N, H, W, C)
+def conv2d(x, kernel, bias):
+    kh, kw, channels, filters = kernel.shape
+    patches = sliding_window_view(x, (kh, kw), axis=(1, 2))
+    n, oh, ow = patches.shape[:3]
+    # (N, OH, OW, C, KH, KW) -> (N * OH * OW, KH * KW * C), matching the kernel layout
+    columns = patches.transpose(0, 1, 2, 4, 5, 3).reshape(n * oh * ow, kh * kw * channels)
+    out = columns @ kernel.reshape(kh * kw * channels, filters) + bias
+    return out.reshape(n, oh, ow, filters)
+
+def max_pool(x, size=2):
+    n, h, w, c = x.shape
+    h, w = h // size, w // size
+    x = x[:, :h * size, :w * size]
+    return x.reshape(n, h, size, w, size, c).max(axis=(2, 4))
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+def soft_max(x):
+    xps = np.exp(x - x.max(axis=1, keepdims=True))
+    return xps / xps.sum(axis=1, keepdims=True)
+
+class CnnEngine:
+    def __init__(self, weights):
+        if [tuple(np.shape(w)) for w in weights] != WEIGHT_SHAPES:
+            raise ValueError("Weights do not match the Numscan 2 architecture.")
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Pickle file '{path}' does not exist.")
+        with open(path, "rb") as handle:
+            return cls(pickle.load(handle))
+
+    def forward(self, x):
+        k1, b1, k2, b2, w3, b3, w4, b4 = self.weights
+        x = max_pool(relu(conv2d(x, k1, b1)))
+        x = max_pool(relu(conv2d(x, k2, b2)))
+        x = relu(x.reshape(len(x), -1) @ w3 + b3)
+        return soft_max(x @ w4 + b4)
+
+    # Same call as keras Model.predict: (N, 28, 28, 1) in [0, 1] to (N, 10) probabilities
+    def predict(self, x, batch_size=256, verbose=0):
+        x = np.asarray(x, dtype=np.float32).reshape(-1, 28, 28, 1)
+        probabilities = np.empty((len(x), 10), dtype=np.float32)
+        for start in range(0, len(x), batch_size):
+            probabilities[start:start + batch_size] = self.forward(x[start:start + batch_size])
+        return probabilities
+
+# Direct-loop versions of the Keras layers, slow but written straight from their definitions.
+# They check the im2col kernel layout and the NHWC flatten order of the engine without Tensorflow
+def reference_conv2d(x, kernel, bias):
+    kh, kw, channels, filters = kernel.shape
+    n, h, w, _ = x.shape
+    out = np.zeros((n, h - kh + 1, w - kw + 1, filters), dtype=np.float64)
+    for i in range(n):
+        for y in range(h - kh + 1):
+            for x0 in range(w - kw + 1):
+                for f in range(filters):
+                    total = bias[f]
+                    for dy in range(kh):
+                        for dx in range(kw):
+                            for c in range(channels):
+                                total += x[i, y + dy, x0 + dx, c] * kernel[dy, dx, c, f]
+                    out[i, y, x0, f] = total
+    return out
+
+def reference_max_pool(x, size=2):
+    n, h, w, c = x.shape
+    out = np.zeros((n, h // size, w // size, c), dtype=x.dtype)
+    for y in range(h // size):
+        for x0 in range(w // size):
+            out[:, y, x0] = x[:, y * size:(y + 1) * size, x0 * size:(x0 + 1) * size].max(axis=(1, 2))
+    return out
+
+# Keras Flatten on channels_last walks height, then width, then channels
+def reference_flatten(x):
+    n, h, w, c = x.shape
+    out = np.zeros((n, h * w * c), dtype=x.dtype)
+    for y in range(h):
+        for x0 in range(w):
+            for ch in range(c):
+                out[:, (y * w + x0) * c + ch] = x[:, y, x0, ch]
+    return out
+
+def reference_forward(weights, x):
+    k1, b1, k2, b2, w3, b3, w4, b4 = [np.asarray(w, dtype=np.float64) for w in weights]
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 28, 28, 1)
+    x = reference_max_pool(np.maximum(reference_conv2d(x, k1, b1), 0))
+    x = reference_max_pool(np.maximum(reference_conv2d(x, k2, b2), 0))
+    x = np.maximum(reference_flatten(x) @ w3 + b3, 0)
+    return soft_max(x @ w4 + b4)
+
+# Largest probability difference between the engine and the direct-loop reference, needs no Tensorflow
+def check_reference(weights=None, samples=2, seed=0):
+    rng = np.random.default_rng(seed)
+    if weights is None:
+        weights = [rng.standard_normal(shape).astype(np.float32) * 0.1 for shape in WEIGHT_SHAPES]
+    x = rng.random((samples, 28, 28, 1), dtype=np.float32)
+    expected = reference_forward(weights, x)
+    actual = CnnEngine(weights).predict(x)
+    return float(np.abs(expected - actual).max())
+
+# Compares the engine with the Keras model on the same weights, needs Tensorflow
+def check_parity(path=MODEL_PATH, samples=256, seed=0):
+    from model import load_model_pickle
+
+    x = np.random.default_rng(seed).random((samples, 28, 28, 1), dtype=np.float32)
+    expected = load_model_pickle(path).predict(x, verbose=0)
+    actual = CnnEngine.load(path).predict(x)
+    return float(np.abs(expected - actual).max()), float((expected.argmax(1) == actual.argmax(1)).mean())
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="NumPy inference for the Numscan 2 CNN")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--parity", action="store_true", help="compare with the Keras model (needs Tensorflow)")
+    parser.add_argument("--reference", action="store_true", help="compare with direct-loop layers, no Tensorflow needed")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.reference:
+        # The reference is slow, a couple of images already exercise every weight
+        weights = CnnEngine.load(args.model).weights if os.path.exists(args.model) else None
+        max_error = check_reference(weights, min(args.samples, 2))
+        print(f"Max probability difference to the reference: {max_error:.2e}")
+        if max_error > args.tolerance:
+            raise SystemExit("Reference check failed.")
+    elif args.parity:
+        max_error, agreement = check_parity(args.model, args.samples)
+        print(f"Max probability difference: {max_error:.2e}, label agreement: {agreement:.4f}")
+        if max_error > args.tolerance:
+            raise SystemExit("Parity check failed.")
+    else:
+        engine = CnnEngine.load(args.model)
+        x = np.random.default_rng(0).random((args.samples, 28, 28, 1), dtype=np.float32)
+        print(engine.predict(x).argmax(axis=1))
@@ -1,21 +1,77 @@
 
 # This file uses the Tensorflow library to train a Convolutional Neural Network model
 
+import argparse
 import os
 import pickle
+import sys
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import datasets, layers, models
 
-MODEL_PATH = "Numscan 2\Models\model.pkl"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+NUMSCAN_SCRIPTS_DIR = os.path.join(PROJECT_DIR, "Numscan", "Scripts")
+PNG_DATA_DIR = os.path.join(PROJECT_DIR, "Numscan", "Data", "mnist-png")
+
+MODEL_PATH = os.path.join(BASE_DIR, "Models", "model.pkl")
 
 # Data stuff
-def load_mnist_data():
-    (x_train, y_train), (x_test, y_test) = datasets.mnist.load_data()
+def load_png_tree(data_dir):
+    if NUMSCAN_SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, NUMSCAN_SCRIPTS_DIR)
+    import load
+
+    # Uses the decoded uint8 cache of the Numscan loader. Other trees get their own cache inside the tree,
+    # so they neither overwrite the shared Numscan cache nor hit it by a matching fingerprint
+    if os.path.abspath(data_dir) != os.path.abspath(load.data_dir):
+        load.cache_dir = os.path.join(data_dir, "cache")
+    load.data_dir = data_dir
+    splits = []
+    for split in ("train", "test"):
+        images, labels = load.load_dataset(split)
+        splits.append((np.asarray(images).reshape(-1, 28, 28), np.asarray(labels)))
+    return splits[0], splits[1]
+
+def load_mnist_arrays(source=None):
+    if source is None:
+        # Prefers the local Png tree, the Keras download needs network access
+        source = PNG_DATA_DIR if os.path.isdir(os.path.join(PNG_DATA_DIR, "train")) else "download"
+
+    if source == "download":
+        return datasets.mnist.load_data()
+    if os.path.isdir(source):
+        return load_png_tree(source)
+    with np.load(source) as data:
+        return (data["x_train"], data["y_train"]), (data["x_test"], data["y_test"])
+
+def load_mnist_data(source=None):
+    (x_train, y_train), (x_test, y_test) = load_mnist_arrays(source)
     x_train = x_train.reshape((x_train.shape[0], 28, 28, 1)).astype("float32") / 255.0
     x_test = x_test.reshape((x_test.shape[0], 28, 28, 1)).astype("float32") / 255.0
     return (x_train, y_train), (x_test, y_test)
 
+def normalize_batch(images, labels):
+    images = tf.cast(tf.expand_dims(images, -1), tf.float32) / 255.0
+    return images, labels
+
+# Keeps the images as uint8 and normalizes whole batches in parallel, cached, shuffled and prefetched
+def make_dataset(images, labels, batch_size=64, shuffle_buffer=10000, threads=0, training=True, seed=None):
+    parallel_calls = threads or tf.data.AUTOTUNE
+    dataset = tf.data.Dataset.from_tensor_slices((images, labels)).cache()
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(normalize_batch, num_parallel_calls=parallel_calls, deterministic=not training)
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+
+    if threads:
+        options = tf.data.Options()
+        options.threading.private_threadpool_size = threads
+        dataset = dataset.with_options(options)
+    return dataset
+
 # Model stuff
 def build_model():
     model = models.Sequential(
@@ -36,7 +92,7 @@ def build_model():
     )
     return model
 
-# Save / Load model 
+# Save / Load model
 def save_model_pickle(model, path=MODEL_PATH):
     with open(path, "wb") as handle:
         pickle.dump(model.get_weights(), handle)
@@ -44,26 +100,55 @@ def save_model_pickle(model, path=MODEL_PATH):
 def load_model_pickle(path=MODEL_PATH):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Pickle file '{path}' does not exist.")
-    
+
     model = build_model()
     with open(path, "rb") as handle:
         weights = pickle.load(handle)
-        
+
     model.set_weights(weights)
     return model
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train or evaluate the Numscan 2 CNN")
+    parser.add_argument("--data", help="mnist.npz file, mnist-png directory or 'download', defaults to Numscan/Data/mnist-png if present")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--retrain", action="store_true", help="train even if the model file exists")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--shuffle-buffer", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=0, help="input pipeline and op threads, 0 lets Tensorflow decide")
+    parser.add_argument("--validation-split", type=float, default=0.1)
+    return parser.parse_args()
+
 # Main loop
 if __name__ == "__main__":
-    (x_train, y_train), (x_test, y_test) = load_mnist_data()
+    args = parse_args()
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(args.threads)
 
-    if os.path.exists(MODEL_PATH):
-        print(f"Loading model weights from '{MODEL_PATH}'")
-        model = load_model_pickle(MODEL_PATH)
+    (x_train, y_train), (x_test, y_test) = load_mnist_arrays(args.data)
+    test_data = make_dataset(x_test, y_test, args.batch_size, threads=args.threads, training=False)
+
+    if os.path.exists(args.model) and not args.retrain:
+        print(f"Loading model weights from '{args.model}'")
+        model = load_model_pickle(args.model)
     else:
         print("Training new model...")
+        split = int(len(x_train) * (1 - args.validation_split))
+        order = np.random.default_rng(0).permutation(len(x_train))
+        train_index, validation_index = order[:split], order[split:]
+
+        train_data = make_dataset(
+            x_train[train_index], y_train[train_index], args.batch_size, args.shuffle_buffer, args.threads
+        )
+        validation_data = make_dataset(
+            x_train[validation_index], y_train[validation_index], args.batch_size, threads=args.threads, training=False
+        )
+
         model = build_model()
-        model.fit(x_train, y_train, epochs=5, batch_size=64, validation_split=0.1)
-        save_model_pickle(model, MODEL_PATH)
+        model.fit(train_data, epochs=args.epochs, validation_data=validation_data)
+        save_model_pickle(model, args.model)
 
-    test_loss, test_acc = model.evaluate(x_test, y_test, verbose=2)
+    test_loss, test_acc = model.evaluate(test_data, verbose=2)
     print(f"\nTest accuracy: {test_acc:.4f}")
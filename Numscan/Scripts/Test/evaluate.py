@@ -0,0 +1,85 @@
+
+# This file evaluates a model on the held-out test split in batches and reports accuracy, confusion matrix and throughput
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+script_path = os.path.join(fixed_path, "Scripts")
+
+if script_path not in sys.path:
+    sys.path.insert(0, script_path)
+
+if fixed_path not in sys.path:
+    sys.path.insert(0, fixed_path)
+
+from load import load_dataset
+from predict import predict_batch
+from network import nn
+
+model_dir = os.path.join(fixed_path, "Models")
+model_path = os.path.join(model_dir, "after.pickle")
+
+def confusion_matrix(labels, predictions, classes=10):
+    matrix = np.zeros((classes, classes), dtype=np.int64)
+    np.add.at(matrix, (labels, predictions), 1)
+    return matrix
+
+def evaluate(path=model_path, batch_size=1000):
+    nn.load(path)
+    nn.to_numpy()
+
+    images, labels = load_dataset("test")
+
+    predictions = np.empty(len(images), dtype=np.int64)
+    start_time = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        X = images[start:start + batch_size] / np.float32(255.0)
+        predictions[start:start + batch_size] = predict_batch(X)[2]
+    seconds = time.perf_counter() - start_time
+
+    matrix = confusion_matrix(labels.astype(np.int64), predictions)
+    per_class = matrix.diagonal() / np.maximum(matrix.sum(axis=1), 1)
+
+    return {
+        'model': path,
+        'samples': len(images),
+        'accuracy': float(matrix.trace() / max(len(images), 1)),
+        'per_class_accuracy': per_class.tolist(),
+        'confusion_matrix': matrix.tolist(),
+        'seconds': seconds,
+        'images_per_second': len(images) / seconds if seconds else 0.0
+    }
+
+def print_summary(summary):
+    print(f"Samples: {summary['samples']}")
+    print(f"Accuracy: {summary['accuracy']:.4f}")
+    print(f"Throughput: {summary['images_per_second']:.0f} images/sec")
+    print("Confusion matrix (rows: label, columns: predicted)")
+    print("     " + " ".join(f"{i:>5}" for i in range(10)))
+    for label, row in enumerate(summary['confusion_matrix']):
+        print(f"{label:>3}: " + " ".join(f"{n:>5}" for n in row) + f"  {summary['per_class_accuracy'][label]:.3f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate a Numscan model on mnist-png/test")
+    parser.add_argument("--model", default=model_path)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--json", help="write the summary as JSON to this file, - for stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = evaluate(args.model, args.batch_size)
+
+    if args.json == "-":
+        print(json.dumps(summary))
+    else:
+        print_summary(summary)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(summary, f, indent=2)
@@ -2,7 +2,11 @@
 # This file runs a single feed forward prediction
 
 import math, random
+
+import numpy as np
+
 from network import nn
+import telemetry
 
 def make_matrix(m: int, n: int):
     return [[random.random() for _ in range(m)] for _ in range(n)]
@@ -27,23 +31,178 @@ def calc_layer(input, layer):
     weights = nn.get_weights(layer)
     biases = nn.get_biases(layer)
 
+    if nn.is_numpy:
+        z = weights @ np.asarray(input, dtype=np.float32) + biases
+        return np.maximum(z, 0), z
+
     z = ma(mm(weights, input), biases)
     return activation_fn(z), z
 
 def soft_max(vector):
+    if isinstance(vector, np.ndarray):
+        xps = np.exp(vector - vector.max())
+        return xps / xps.sum()
     max_val = max(vector)
     xps = [math.exp(x - max_val) for x in vector]
     sum_exps = sum(xps)
     return [val / sum_exps for val in xps]
 
+# Runs every layer of nn, returns the activations and pre-activations of each
 def exec(input):
-    x2, z2 = calc_layer(input, 0)
-    x3, z3 = calc_layer(x2, 1)
-    x4, z4 = calc_layer(x3, 2)
+    xs, zs = [], []
+    x = input
+    for layer in range(nn.num_layers - 1):
+        with telemetry.layer_timer("exec", layer):
+            x, z = calc_layer(x, layer)
+        xs.append(x)
+        zs.append(z)
 
-    return [x2, x3, x4], [z2, z3, z4]
+    return xs, zs
 
 def feed_forward(input_layer):
     logits = exec(input_layer)[1][-1]
     out_y = soft_max(logits)
+    if isinstance(out_y, np.ndarray):
+        return int(np.argmax(out_y))
     return out_y.index(max(out_y))
+
+# Keeps the layer 0 pre-activations of the last input, so the next input only pays for the pixels that changed.
+# Call reset() after the weights were changed in place, loading a model is detected on its own
+class IncrementalExec:
+    def __init__(self, full_fraction=0.25, refresh_every=500):
+        self.full_fraction = full_fraction
+        self.refresh_every = refresh_every
+        self.reset()
+
+    def reset(self):
+        self.weights = None
+        self.input = None
+        self.z = None
+        self.updates = 0
+
+    def _full(self, input, weights):
+        _, z = calc_layer(input, 0)
+        self.weights = weights
+        self.z = np.array(z, dtype=np.float32) if nn.is_numpy else list(z)
+        self.updates = 0
+
+    def _apply(self, input, changed):
+        weights = self.weights
+        if nn.is_numpy:
+            self.z += weights[:, changed] @ (input[changed] - self.input[changed])
+            return
+        deltas = [(j, float(input[j] - self.input[j])) for j in changed]
+        for i, row in enumerate(weights):
+            self.z[i] += sum(row[j] * delta for j, delta in deltas)
+
+    # Same result as exec(input)
+    def exec(self, input):
+        input = np.asarray(input, dtype=np.float32).reshape(-1)
+        weights = nn.get_weights(0)
+
+        if self.weights is not weights or self.input is None or self.updates >= self.refresh_every:
+            self._full(input, weights)
+        else:
+            changed = np.flatnonzero(input != self.input)
+            if len(changed) > self.full_fraction * len(input):
+                self._full(input, weights)
+            elif len(changed):
+                self._apply(input, changed)
+                self.updates += 1
+        self.input = input
+
+        if nn.is_numpy:
+            z = self.z.copy()
+            x = np.maximum(z, 0)
+        else:
+            z = list(self.z)
+            x = activation_fn(z)
+        xs, zs = [x], [z]
+        for layer in range(1, nn.num_layers - 1):
+            x, z = calc_layer(x, layer)
+            xs.append(x)
+            zs.append(z)
+        return xs, zs
+
+
+def soft_max_batch(matrix):
+    xps = np.exp(matrix - matrix.max(axis=1, keepdims=True))
+    return xps / xps.sum(axis=1, keepdims=True)
+
+def layer_arrays(layer):
+    weights = nn.get_weights(layer)
+    biases = nn.get_biases(layer)
+    if nn.is_numpy:
+        return weights, biases
+    return np.asarray(weights, dtype=np.float32), np.asarray(biases, dtype=np.float32)
+
+# Runs the feed forward for a whole (N, 784) batch, chunk_size caps the rows computed at once
+def predict_batch(X, chunk_size=None):
+    layers = [layer_arrays(layer) for layer in range(nn.num_layers - 1)]
+    if not isinstance(X, np.ndarray):
+        X = np.asarray(X, dtype=np.float32)
+    X = X.reshape(len(X), layers[0][0].shape[1])
+
+    total = len(X)
+    chunk_size = chunk_size or max(total, 1)
+    logits = np.empty((total, len(layers[-1][1])), dtype=np.float32)
+
+    for start in range(0, total, chunk_size):
+        a = X[start:start + chunk_size].astype(np.float32, copy=False)
+        for weights, biases in layers:
+            z = a @ weights.T + biases
+            a = np.maximum(z, 0)
+        logits[start:start + chunk_size] = z
+
+    probs = soft_max_batch(logits)
+    labels = probs.argmax(axis=1)
+    return logits, probs, labels
+
+# Sums of int8 products over at most this many inputs are exact in float32, so BLAS can accumulate them
+EXACT_INT8_INPUTS = 2 ** 24 // (127 * 127)
+
+def quantize_activations(a, scale=None):
+    if scale is None:
+        scale = np.abs(a).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+    return np.clip(np.rint(a / scale), -127, 127), scale
+
+def int_mm(a_q, w_q):
+    if w_q.shape[1] <= EXACT_INT8_INPUTS:
+        return a_q.astype(np.float32) @ w_q.T.astype(np.float32)
+    return (a_q.astype(np.int32) @ w_q.T.astype(np.int32)).astype(np.float32)
+
+def calc_layer_int8(qnet, a, layer):
+    a_q, a_scale = quantize_activations(a, qnet.get_input_scale(layer))
+    z = int_mm(a_q, qnet.get_weights(layer)) * (a_scale * qnet.get_scales(layer)) + qnet.get_biases(layer)
+    return np.maximum(z, 0), z
+
+# Same as exec, but with the int8 layers of a QuantizedNetwork
+def exec_int8(qnet, input):
+    xs, zs = [], []
+    x = np.asarray(input, dtype=np.float32).reshape(1, -1)
+    for layer in range(qnet.num_layers - 1):
+        x, z = calc_layer_int8(qnet, x, layer)
+        xs.append(x[0])
+        zs.append(z[0])
+
+    return xs, zs
+
+def predict_batch_int8(qnet, X, chunk_size=None):
+    if not isinstance(X, np.ndarray):
+        X = np.asarray(X, dtype=np.float32)
+    X = X.reshape(len(X), qnet.layer_sizes[0])
+
+    total = len(X)
+    chunk_size = chunk_size or max(total, 1)
+    logits = np.empty((total, qnet.layer_sizes[-1]), dtype=np.float32)
+
+    for start in range(0, total, chunk_size):
+        a = X[start:start + chunk_size].astype(np.float32, copy=False)
+        for layer in range(qnet.num_layers - 1):
+            a, z = calc_layer_int8(qnet, a, layer)
+        logits[start:start + chunk_size] = z
+
+    probs = soft_max_batch(logits)
+    labels = probs.argmax(axis=1)
+    return logits, probs, labels
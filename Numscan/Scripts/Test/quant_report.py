@@ -0,0 +1,75 @@
+
+# This file quantizes a model to int8 and compares its accuracy and latency with float32 on the test split
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+script_path = os.path.join(fixed_path, "Scripts")
+
+if script_path not in sys.path:
+    sys.path.insert(0, script_path)
+
+if fixed_path not in sys.path:
+    sys.path.insert(0, fixed_path)
+
+from load import load_dataset, load_index
+from predict import exec, exec_int8, predict_batch, predict_batch_int8
+from quantize import quantize
+from network import nn
+
+model_dir = os.path.join(fixed_path, "Models")
+model_path = os.path.join(model_dir, "after.nsm")
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+def report(path=model_path, calibration_size=1000, repeats=5, save=None):
+    nn.load(path)
+    nn.to_numpy()
+
+    images, labels = load_dataset("test")
+    X = images / np.float32(255.0)
+
+    calibration = None
+    if calibration_size:
+        index = load_index("train")
+        samples = index.sample(calibration_size, rng=np.random.default_rng(0))
+        calibration = index.pixels(samples) / np.float32(255.0)
+
+    qnet = quantize(nn, calibration)
+    if save:
+        qnet.save(save)
+        print(f"Saved {save}")
+
+    (_, _, float_labels), float_batch = timed(lambda: predict_batch(X), repeats)
+    (_, _, int8_labels), int8_batch = timed(lambda: predict_batch_int8(qnet, X), repeats)
+    _, float_single = timed(lambda: exec(X[0]), repeats * 20)
+    _, int8_single = timed(lambda: exec_int8(qnet, X[0]), repeats * 20)
+
+    float_size = sum(w.nbytes + b.nbytes for w, b in zip(nn.weights, nn.biases))
+
+    print(f"Samples: {len(X)}, calibration: {calibration_size or 'dynamic'}")
+    print(f"{'':10}{'accuracy':>10}{'batch img/s':>14}{'single ms':>12}{'bytes':>10}")
+    print(f"{'float32':10}{(float_labels == labels).mean():>10.4f}{len(X) / float_batch:>14.0f}{float_single * 1000:>12.3f}{float_size:>10}")
+    print(f"{'int8':10}{(int8_labels == labels).mean():>10.4f}{len(X) / int8_batch:>14.0f}{int8_single * 1000:>12.3f}{qnet.nbytes():>10}")
+    print(f"Agreement: {(float_labels == int8_labels).mean():.4f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare int8 quantized inference with float32")
+    parser.add_argument("--model", default=model_path)
+    parser.add_argument("--calibration-size", type=int, default=1000, help="training samples for activation scales, 0 for dynamic scales")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--save", help="write the quantized model (.npz) to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    report(args.model, args.calibration_size, args.repeats, args.save)
@@ -0,0 +1,161 @@
+
+# This file trains the network data-parallel over several processes that share the weights through shared memory
+
+import multiprocessing as mp
+import os
+import sys
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+script_path = os.path.join(fixed_path, "Scripts")
+train_path = os.path.dirname(os.path.abspath(__file__))
+
+for path in (train_path, script_path, fixed_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from train import batch_gradients
+from load import iter_batches, load_dataset
+from network import NeuralNetworkStorage, nn
+
+# Hogwild workers report their progress to the trainer every this many batches
+PROGRESS_BATCHES = 10
+
+def attach(name, layer_sizes, offset=0):
+    shm = shared_memory.SharedMemory(name=name)
+    network = NeuralNetworkStorage()
+    network._bind_buffer(shm.buf, layer_sizes, offset)
+    return shm, network
+
+def hogwild_step(network, X, y, learning_rate):
+    grads_w, grads_b, error = batch_gradients(network.weights, network.biases, X, y)
+    for layer in range(len(grads_w)):
+        network.weights[layer] -= learning_rate * grads_w[layer]
+        network.biases[layer] -= learning_rate * grads_b[layer]
+    return error
+
+def worker(conn, param_name, grad_name, layer_sizes, index):
+    param_shm, network = attach(param_name, layer_sizes)
+    grad_shm, grads = attach(grad_name, layer_sizes, index * network._payload_size(layer_sizes) * 4)
+    images, labels = load_dataset("train")
+
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            mode, indices, batch_size, learning_rate, scale = message
+            if mode == "sync":
+                # Writes this shard's share of the batch gradient into its own row of the gradient buffer
+                X, y = next(iter_batches(images, labels, len(indices), indices))
+                grads_w, grads_b, error = batch_gradients(network.weights, network.biases, X, y)
+                for layer in range(len(grads_w)):
+                    grads.weights[layer][...] = grads_w[layer] * scale
+                    grads.biases[layer][...] = grads_b[layer] * scale
+                conn.send([error])
+            else:
+                # Hogwild: updates the shared weights directly and without any lock
+                errors = []
+                done = 0
+                for X, y in iter_batches(images, labels, batch_size, indices):
+                    errors.append(hogwild_step(network, X, y, learning_rate))
+                    done += len(y)
+                    if len(errors) % PROGRESS_BATCHES == 0:
+                        conn.send(("progress", done, errors[-1]))
+                        done = 0
+                if done:
+                    conn.send(("progress", done, errors[-1]))
+                conn.send(("done", errors))
+    finally:
+        del network, grads
+        param_shm.close()
+        grad_shm.close()
+
+class ParallelTrainer:
+    def __init__(self, workers, mode="sync"):
+        if mode not in ("sync", "hogwild"):
+            raise ValueError(f"Unknown parallel mode '{mode}'.")
+        if not nn.is_numpy:
+            nn.to_numpy()
+
+        self.mode = mode
+        self.layer_sizes = tuple(int(size) for size in nn.layer_sizes)
+        self.param_count = nn._payload_size(self.layer_sizes)
+
+        payload = nn._payload_bytes()
+        self.param_shm = shared_memory.SharedMemory(create=True, size=len(payload))
+        self.param_shm.buf[:len(payload)] = payload
+        self.grad_shm = shared_memory.SharedMemory(create=True, size=workers * self.param_count * 4)
+
+        # From here on nn trains directly on the shared copy of the weights
+        nn._bind_buffer(self.param_shm.buf, self.layer_sizes)
+        self.params = np.frombuffer(self.param_shm.buf, dtype=np.float32, count=self.param_count)
+        self.grads = np.frombuffer(self.grad_shm.buf, dtype=np.float32).reshape(workers, self.param_count)
+
+        self.connections = []
+        self.processes = []
+        for index in range(workers):
+            parent_conn, child_conn = mp.Pipe()
+            process = mp.Process(
+                target=worker,
+                args=(child_conn, self.param_shm.name, self.grad_shm.name, self.layer_sizes, index),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def sync_step(self, batch, learning_rate):
+        shards = [shard for shard in np.array_split(batch, len(self.connections)) if len(shard)]
+        for conn, shard in zip(self.connections, shards):
+            conn.send(("sync", shard, len(shard), learning_rate, len(shard) / len(batch)))
+
+        errors = [conn.recv()[0] for conn in self.connections[:len(shards)]]
+        self.params -= learning_rate * self.grads[:len(shards)].sum(axis=0)
+        return float(np.average(errors, weights=[len(shard) for shard in shards]))
+
+    # Runs one epoch in the given order from sample start and returns the batch errors
+    def run_epoch(self, order, start, batch_size, learning_rate, on_step=None):
+        errors = []
+        if self.mode == "sync":
+            for step, offset in enumerate(range(start, len(order), batch_size), 1):
+                errors.append(self.sync_step(order[offset:offset + batch_size], learning_rate))
+                if on_step:
+                    on_step(step, min(offset + batch_size, len(order)), errors[-1])
+            return errors
+
+        parts = np.array_split(order[start:], len(self.connections))
+        for conn, part in zip(self.connections, parts):
+            conn.send(("hogwild", part, batch_size, learning_rate, 1.0))
+        # Progress messages arrive from all workers interleaved, each one advances the shared sample count
+        pending = list(self.connections)
+        done, step = start, 0
+        while pending:
+            for conn in wait(pending):
+                message = conn.recv()
+                if message[0] == "progress":
+                    done += message[1]
+                    step += 1
+                    if on_step:
+                        on_step(step, done, message[2])
+                else:
+                    errors.extend(message[1])
+                    pending.remove(conn)
+        return errors
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(None)
+        for process in self.processes:
+            process.join()
+
+        # Gives nn its own copy again before the shared memory goes away
+        del self.params, self.grads
+        nn.to_numpy(copy=True)
+        for shm in (self.param_shm, self.grad_shm):
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,129 @@
+
+# This file trains several network topologies and compares their test accuracy with their prediction latency
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+script_path = os.path.join(fixed_path, "Scripts")
+test_path = os.path.join(script_path, "Test")
+
+for path in (test_path, script_path, fixed_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from training import run_epoch
+from load import load_dataset
+from predict import exec, predict_batch
+from network import nn
+
+model_dir = os.path.join(fixed_path, "Models")
+
+# Hidden layer sizes, "128,128" is the default Numscan network and "-" a plain softmax regression
+DEFAULT_TOPOLOGIES = ["-", "32", "64", "128", "128,128", "256,128"]
+
+def parse_topology(text):
+    return tuple(int(size) for size in text.split(",") if size.strip() not in ("", "-"))
+
+# Median milliseconds of a single exec() call, the latency of one drawn digit in the editor or the bot
+def single_latency(x, repeats=200):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        exec(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+def train_topology(hidden, images, labels, epochs, batch_size, learning_rate, seed):
+    random.seed(seed)
+    nn.reset(images.shape[1], *hidden, 10)
+    nn.to_numpy()
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for epoch in range(epochs):
+        errors = run_epoch(images, labels, rng.permutation(len(images)), 0, batch_size, learning_rate)
+        print(f"  Epoch {epoch + 1}/{epochs}, Error (CE): {float(np.mean(errors)):.4f}")
+    return time.perf_counter() - start
+
+def sweep(topologies, epochs=1, batch_size=32, learning_rate=0.1, seed=0, save_dir=None):
+    images, labels = load_dataset("train")
+    test_images, test_labels = load_dataset("test")
+    X_test = test_images / np.float32(255.0)
+
+    results = []
+    for hidden in topologies:
+        print(f"Train {'-'.join(str(size) for size in (X_test.shape[1], *hidden, 10))}")
+        train_seconds = train_topology(hidden, images, labels, epochs, batch_size, learning_rate, seed)
+
+        start = time.perf_counter()
+        predictions = predict_batch(X_test)[2]
+        batch_seconds = time.perf_counter() - start
+
+        result = {
+            'layer_sizes': [int(size) for size in nn.layer_sizes],
+            'parameters': int(sum(w.size + b.size for w, b in zip(nn.weights, nn.biases))),
+            'accuracy': float((predictions == test_labels).mean()) if len(X_test) else 0.0,
+            'single_ms': single_latency(X_test[0]) if len(X_test) else 0.0,
+            'images_per_second': len(X_test) / batch_seconds if batch_seconds else 0.0,
+            'train_seconds': train_seconds,
+        }
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            result['model'] = os.path.join(save_dir, f"sweep-{'-'.join(str(s) for s in result['layer_sizes'])}.nsm")
+            nn.save_to_binary(result['model'])
+        results.append(result)
+    return results
+
+# Smallest model, by parameter count, that reaches the accuracy target
+def pick(results, target):
+    passing = [r for r in results if r['accuracy'] >= target]
+    return min(passing, key=lambda r: (r['parameters'], r['single_ms']), default=None)
+
+def print_table(results, target):
+    print(f"{'layers':<20}{'params':>10}{'accuracy':>10}{'single ms':>11}{'batch img/s':>13}{'train s':>9}")
+    for r in sorted(results, key=lambda r: r['parameters']):
+        layers = "-".join(str(size) for size in r['layer_sizes'])
+        print(f"{layers:<20}{r['parameters']:>10}{r['accuracy']:>10.4f}{r['single_ms']:>11.3f}"
+              f"{r['images_per_second']:>13.0f}{r['train_seconds']:>9.1f}")
+
+    best = pick(results, target)
+    if best:
+        print(f"Smallest model with accuracy >= {target}: {'-'.join(str(s) for s in best['layer_sizes'])}")
+    else:
+        print(f"No model reached accuracy {target}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train several Numscan topologies and compare accuracy with latency")
+    parser.add_argument("--topologies", nargs="+", default=DEFAULT_TOPOLOGIES,
+                        help="comma separated hidden layer sizes per topology, - for none")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", type=float, default=0.97, help="accuracy the chosen model has to reach")
+    parser.add_argument("--save-dir", help="save every trained model as .nsm into this directory")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = sweep(
+        [parse_topology(text) for text in args.topologies],
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        seed=args.seed,
+        save_dir=args.save_dir,
+    )
+    print_table(results, args.target)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'target': args.target, 'results': results, 'best': pick(results, args.target)}, f, indent=2)
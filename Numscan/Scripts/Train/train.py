@@ -16,15 +16,18 @@ if script_path not in sys.path:
 if test_path not in sys.path:
     sys.path.insert(0, test_path)
 
-from predict import exec, soft_max
+import numpy as np
+
+from predict import exec, soft_max, soft_max_batch
 from network import nn
+import telemetry
 
 def cross_entropy(probs: list[float], label: int, eps: float = 1e-12):
     p_true = max(min(probs[label], 1.0 - eps), eps)
     return -math.log(p_true)
 
-def ground_truth_vec(label):
-    return [1 if i == label else 0 for i in range(10)]
+def ground_truth_vec(label, size=10):
+    return [1 if i == label else 0 for i in range(size)]
 
 def vec_sub(v1, v2):
     return [v1[i] - v2[i] for i in range(len(v1))]
@@ -61,44 +64,88 @@ def update_w(weigths, gradients, learning_rate=0.001):
 def update_b(biases, gradients, learning_rate=0.001):
     return [b - learning_rate * g for b, g in zip(biases, gradients)]
 
-def back_propagation(input_layer, label):
-    a, z = exec(input_layer)
-
-    y_hat = soft_max(z[-1])
-    error = cross_entropy(y_hat, label)
-    print(f"Error (CE): {error}")
-
-    activations = [input_layer] + a
-
-    delta_4 = vec_sub(y_hat, ground_truth_vec(label))
-
-    grad_4 = outer_p(delta_4, activations[-2])
-    grad_bias_4 = delta_4
-
-    weights = nn.get_weights(2)
-    nn.set_weights(2, update_w(weights, grad_4))
+# Single sample SGD step over all layers of nn, numpy storage goes through the batch path with a batch of one
+def back_propagation(input_layer, label, learning_rate=0.001):
+    if nn.is_numpy:
+        return back_propagation_batch([input_layer], [label], learning_rate)
 
-    biases = nn.get_biases(2)
-    nn.set_biases(2, update_b(biases, grad_bias_4))
+    with telemetry.timer("backprop.forward"):
+        a, z = exec(input_layer)
 
-    delta_3 = vec_mul(mm(T(nn.get_weights(2)), delta_4), relu_der(z[-2]))
+        y_hat = soft_max(z[-1])
+        error = cross_entropy(y_hat, label)
 
-    grad_3 = outer_p(delta_3, activations[-3])
-    grad_bias_3 = delta_3
-
-    weights = nn.get_weights(1)
-    nn.set_weights(1, update_w(weights, grad_3))
-
-    biases = nn.get_biases(1)
-    nn.set_biases(1, update_b(biases, grad_bias_3))
-
-    delta_2 = vec_mul(mm(T(nn.get_weights(1)), delta_3), relu_der(z[-3]))
-
-    grad_2 = outer_p(delta_2, activations[-4])
-    grad_bias_2 = delta_2
-
-    weights = nn.get_weights(0)
-    nn.set_weights(0, update_w(weights, grad_2))
+    activations = [input_layer] + a
 
-    biases = nn.get_biases(0)
-    nn.set_biases(0, update_b(biases, grad_bias_2))
+    delta = vec_sub(y_hat, ground_truth_vec(label, len(y_hat)))
+    for layer in reversed(range(nn.num_layers - 1)):
+        with telemetry.layer_timer("backprop", layer):
+            grad = outer_p(delta, activations[layer])
+
+            weights = nn.get_weights(layer)
+            nn.set_weights(layer, update_w(weights, grad, learning_rate))
+
+            biases = nn.get_biases(layer)
+            nn.set_biases(layer, update_b(biases, delta, learning_rate))
+
+            # Like before, the delta of the layer below goes through the already updated weights
+            if layer:
+                delta = vec_mul(mm(T(nn.get_weights(layer)), delta), relu_der(z[layer - 1]))
+
+    return error
+
+
+# Computes the averaged gradients of a whole (N, 784) batch with matrix operations
+def batch_gradients(weights, biases, X, labels, eps: float = 1e-12):
+    with telemetry.timer("backprop_batch.forward"):
+        activations = [X]
+        zs = []
+        for w, b in zip(weights, biases):
+            z = activations[-1] @ w.T + b
+            zs.append(z)
+            activations.append(np.maximum(z, 0))
+
+        rows = np.arange(len(X))
+        probs = soft_max_batch(zs[-1])
+        error = float(-np.log(np.clip(probs[rows, labels], eps, 1.0 - eps)).mean())
+
+    with telemetry.timer("backprop_batch.backward"):
+        delta = probs
+        delta[rows, labels] -= 1
+        delta /= len(X)
+
+        grads_w = [None] * len(weights)
+        grads_b = [None] * len(biases)
+        for layer in reversed(range(len(weights))):
+            grads_w[layer] = delta.T @ activations[layer]
+            grads_b[layer] = delta.sum(axis=0)
+            if layer:
+                delta = (delta @ weights[layer]) * (zs[layer - 1] > 0)
+
+    return grads_w, grads_b, error
+
+# Runs one SGD step for a mini-batch and returns its mean cross entropy
+def back_propagation_batch(X, labels, learning_rate=0.1):
+    # Memory-mapped models are read-only, training needs its own copy
+    if not nn.is_numpy or not all(w.flags.writeable for w in nn.weights + nn.biases):
+        nn.to_numpy(copy=True)
+
+    X = np.asarray(X, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int64)
+
+    grads_w, grads_b, error = batch_gradients(nn.weights, nn.biases, X, labels)
+    with telemetry.timer("backprop_batch.update"):
+        for layer in range(len(grads_w)):
+            nn.get_weights(layer)[...] -= learning_rate * grads_w[layer]
+            nn.get_biases(layer)[...] -= learning_rate * grads_b[layer]
+
+    return error
+
+# Runs mini-batch SGD over all samples once, in the given order
+def train_epoch(X, labels, batch_size=32, learning_rate=0.1):
+    errors = []
+    for start in range(0, len(X), batch_size):
+        errors.append(back_propagation_batch(
+            X[start:start + batch_size], labels[start:start + batch_size], learning_rate
+        ))
+    return float(np.mean(errors)) if errors else 0.0
@@ -1,10 +1,13 @@
 
-# This file runs back propergation for all samples in Data
+# This file runs mini-batch back propergation for all samples in Data over several epochs
 
+import argparse
 import os
-import random
+import pickle
 import sys
 
+import numpy as np
+
 fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 script_path = os.path.join(fixed_path, "Scripts")
 if script_path not in sys.path:
@@ -13,37 +16,158 @@ if fixed_path not in sys.path:
     sys.path.insert(0, fixed_path
 )
 
-from train import back_propagation
-from load import load_trainings_data
+from train import back_propagation_batch
+from load import iter_batches, load_dataset
 from network import nn
+import telemetry
+from parallel import ParallelTrainer
 
 model_dir = os.path.join(fixed_path, "Models")
 model_path = os.path.join(model_dir, "after.pickle")
+binary_model_path = os.path.join(model_dir, "after.nsm")
+checkpoint_path = os.path.join(model_dir, "checkpoint.pickle")
 
-def training():
-    print("load pickle? Y/N")
-    if input() == "Y":
-        nn.load_from_pickle(model_path)
-    else:
-        pass
+def save_checkpoint(path, epoch, offset, rng_state):
+    data = {
+        'layer_sizes': nn.layer_sizes,
+        'weights': nn.weights,
+        'biases': nn.biases,
+        'epoch': epoch,
+        'offset': offset,
+        'rng_state': rng_state
+    }
+
+    # Write to a temporary file first so a killed job never leaves a broken checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+
+    nn.layer_sizes = data['layer_sizes']
+    nn.num_layers = len(nn.layer_sizes)
+    nn.weights = data['weights']
+    nn.biases = data['biases']
+    nn.to_numpy()
+    return data['epoch'], data['offset'], data['rng_state']
+
+def load_data():
     print("Load")
-    data_matrix = load_trainings_data()
+    images, labels = load_dataset("train")
     print("Loaded")
+    return images, labels
+
+def run_epoch(images, labels, order, start, batch_size, learning_rate, on_step=None):
+    errors = []
+    for step, (X, y) in enumerate(iter_batches(images, labels, batch_size, order, start), 1):
+        errors.append(back_propagation_batch(X, y, learning_rate))
+        start += len(X)
+        if on_step:
+            on_step(step, start, errors[-1])
+    return errors
+
+def training(epochs=1, learning_rate=0.1, batch_size=32, resume=False, load_model=False,
+             checkpoint=checkpoint_path, checkpoint_every=500, seed=None, workers=1, mode="sync",
+             progress_every=5.0, profile=False, metrics=None, hidden=None):
+    rng = np.random.default_rng(seed)
+    start_epoch, offset = 0, 0
 
-    data_sets = [(row[0], row[1:]) for row in data_matrix]
-    print("Shuffle")
-    random.shuffle(data_sets)
-    print("Shuffled")
+    if resume and os.path.exists(checkpoint):
+        start_epoch, offset, rng_state = load_checkpoint(checkpoint)
+        rng.bit_generator.state = rng_state
+        print(f"Resume from epoch {start_epoch}, sample {offset}")
+    elif load_model:
+        nn.load_from_pickle(model_path)
+    elif hidden:
+        nn.reset(nn.layer_sizes[0], *hidden, nn.layer_sizes[-1])
+    nn.to_numpy()
+
+    images, labels = load_data()
+
+    if profile or metrics:
+        telemetry.enable(metrics)
+
+    # Hogwild workers run through their parts of an epoch on their own, so it is only checkpointed at the end
+    trainer = ParallelTrainer(workers, mode) if workers > 1 else None
+    step_checkpoints = checkpoint_every and (trainer is None or mode == "sync")
 
     print("Train")
-    for i, data_set in enumerate(data_sets):
-        y, X = data_set
-        print(f"Epach E: {i}, Label: {y}")
-        back_propagation(X, y)
+    try:
+        for epoch in range(start_epoch, epochs):
+            # The order of an epoch is drawn from the state saved with the checkpoint, so a resumed job sees the same order
+            epoch_state = rng.bit_generator.state
+            order = rng.permutation(len(images))
+            progress = telemetry.ProgressReporter(len(images) - offset, progress_every, telemetry.writer, f"Epoch {epoch + 1}")
+            first = offset
+
+            def on_step(step, done, error):
+                progress.update(done - first - progress.done, error)
+                if step_checkpoints and step % checkpoint_every == 0:
+                    save_checkpoint(checkpoint, epoch, done, epoch_state)
+
+            if trainer:
+                errors = trainer.run_epoch(order, offset, batch_size, learning_rate, on_step)
+            else:
+                errors = run_epoch(images, labels, order, offset, batch_size, learning_rate, on_step)
+            offset = 0
+
+            save_checkpoint(checkpoint, epoch + 1, 0, rng.bit_generator.state)
+            error = float(np.mean(errors)) if errors else 0.0
+            print(f"Epoch {epoch + 1}/{epochs}, Error (CE): {error}")
+            if telemetry.writer:
+                telemetry.writer.write("epoch", epoch=epoch + 1, loss=error)
+    finally:
+        if trainer:
+            trainer.close()
+        # The timer summary goes into the metrics file as well, so it is written before the file is closed.
+        # Both also happen when training is interrupted
+        if profile:
+            telemetry.print_summary()
+        telemetry.disable()
     print("Trained")
 
     print("Save")
+    # The binary copy is what the bot, the server and the editor load, it has to match the pickle
     nn.save_to_pickle(model_path)
+    nn.save_to_binary(binary_model_path)
     print("Saved")
 
-training()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the Numscan network without prompts")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint if it exists")
+    parser.add_argument("--load-model", action="store_true", help="start from the saved after.pickle weights")
+    parser.add_argument("--checkpoint", default=checkpoint_path)
+    parser.add_argument("--checkpoint-every", type=int, default=500, help="batches between checkpoints, 0 disables")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="training processes, more than 1 trains data-parallel")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--profile", action="store_true", help="time every training phase and print a summary")
+    parser.add_argument("--metrics", help="append progress and timing metrics as JSONL to this file")
+    parser.add_argument("--hidden", type=int, nargs="+", help="hidden layer sizes of a new network, default 128 128")
+    parser.add_argument("--mode", choices=("sync", "hogwild"), default="sync", help="averaged gradients per batch or lock-free asynchronous updates")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    training(
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        batch_size=args.batch_size,
+        resume=args.resume,
+        load_model=args.load_model,
+        checkpoint=args.checkpoint,
+        checkpoint_every=args.checkpoint_every,
+        seed=args.seed,
+        workers=args.workers,
+        mode=args.mode,
+        progress_every=args.progress_every,
+        profile=args.profile,
+        metrics=args.metrics,
+        hidden=args.hidden,
+    )
@@ -0,0 +1,28 @@
+
+# This file converts a pickle or json model into the binary model format
+
+import argparse
+import os
+import sys
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if fixed_path not in sys.path:
+    sys.path.insert(0, fixed_path)
+
+from network import nn
+
+def convert(source, target=None):
+    target = target or os.path.splitext(source)[0] + ".nsm"
+    nn.load(source)
+    nn.save_to_binary(target)
+    return target
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert a Numscan model to the binary .nsm format")
+    parser.add_argument("source", help="model file (.pickle, .pkl or .json)")
+    parser.add_argument("target", nargs="?", help="output file, defaults to the source name with .nsm")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"Saved {convert(args.source, args.target)}")
@@ -1,32 +1,258 @@
 
 # This file loads all images and converts the pixelvalues into a matrix
 
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from PIL import Image
+import json
 import os
+import random
+import sys
+
+import numpy as np
 
 fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if fixed_path not in sys.path:
+    sys.path.insert(0, fixed_path)
+
+from preprocess import image_to_pixels
+
 data_dir = os.path.join(fixed_path, "Data", "mnist-png")
+cache_dir = os.path.join(fixed_path, "Data", "cache")
 
-def load_trainings_data():
-    data_matrix = []
-    total = 0
+def list_images(split="train"):
+    files = []
     for i in range(10):
-        total += len(os.listdir(os.path.join(data_dir, "train", str(i))))
-    loaded = 0
+        class_dir = os.path.join(data_dir, split, str(i))
+        with os.scandir(class_dir) as entries:
+            files.extend((i, entry) for entry in entries if entry.is_file())
+    files.sort(key=lambda item: (item[0], item[1].name))
+    return files
+
+def fingerprint(files):
+    return {
+        'count': len(files),
+        'mtime': max((entry.stat().st_mtime_ns for _, entry in files), default=0)
+    }
+
+def decode_chunk(paths):
+    images = np.empty((len(paths), 784), dtype=np.uint8)
+    for i, path in enumerate(paths):
+        with Image.open(path) as img:
+            images[i] = image_to_pixels(img).reshape(-1)
+    return images
+
+# Decodes the images in chunks spread over a process pool, the result keeps the order of paths.
+# Progress goes to stderr, so tools that write JSON to stdout stay parseable
+def decode_images(paths, workers=None, chunk_size=1000):
+    images = np.empty((len(paths), 784), dtype=np.uint8)
+    total = len(paths)
     if total:
-        print(f"Loading {total} images...")
+        print(f"Loading {total} images...", file=sys.stderr)
 
-    for i in range(10):
+    chunks = [paths[start:start + chunk_size] for start in range(0, total, chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    # A pool started from a pool worker (or a spawned child re-importing its script) would recurse, so decode serially there
+    if multiprocessing.current_process().name != "MainProcess":
+        workers = 1
+
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        results = executor.map(decode_chunk, chunks) if executor else map(decode_chunk, chunks)
+        loaded = 0
+        for chunk_images in results:
+            images[loaded:loaded + len(chunk_images)] = chunk_images
+            loaded += len(chunk_images)
+            print(f"Loaded {loaded}/{total}", file=sys.stderr)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return images
+
+def cache_paths(split):
+    return (
+        os.path.join(cache_dir, f"{split}-images.npy"),
+        os.path.join(cache_dir, f"{split}-labels.npy"),
+        os.path.join(cache_dir, f"{split}.json"),
+    )
+
+# Every process writes its own temporary file, so processes that rebuild the cache at the same time don't collide
+def temporary_path(path):
+    return f"{path}.{os.getpid()}.tmp"
+
+def write_cache(split, images, labels, meta):
+    os.makedirs(cache_dir, exist_ok=True)
+    images_path, labels_path, meta_path = cache_paths(split)
+
+    for path, array in ((images_path, images), (labels_path, labels)):
+        tmp_path = temporary_path(path)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    # The fingerprint is written last, it marks the cache as complete
+    tmp_path = temporary_path(meta_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def read_cache(split, meta):
+    images_path, labels_path, meta_path = cache_paths(split)
+    try:
+        with open(meta_path, 'r') as f:
+            if json.load(f) != meta:
+                return None
+        return np.load(images_path, mmap_mode="r"), np.load(labels_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+# Returns (images, labels) as uint8 arrays of shape (N, 784) and (N,), memory-mapped from the cache
+def load_dataset(split="train", workers=None):
+    files = list_images(split)
+    return load_files(split, files, fingerprint(files), workers)
+
+# Same as load_dataset for files already listed by list_images, meta is their fingerprint
+def load_files(split, files, meta, workers=None):
+    cached = read_cache(split, meta)
+    if cached is not None:
+        return cached
+
+    images = decode_images([entry.path for _, entry in files], workers)
+    labels = np.array([i for i, _ in files], dtype=np.uint8)
+    write_cache(split, images, labels, meta)
+    return read_cache(split, meta)
 
-        for filename in os.listdir(os.path.join(data_dir, "train", str(i))):
-            path = os.path.join(data_dir, "train", str(i), filename)
+def index_path(split):
+    return os.path.join(cache_dir, f"{split}-index.npz")
 
-            img = Image.open(path).convert("L")
-            pixels = [p / 255.0 for p in list(img.getdata())]
+def read_cache_meta(split):
+    try:
+        with open(cache_paths(split)[2], 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# File names, labels and byte offsets of every sample in the decoded cache of one split.
+# Samples are sorted by label, so a label is a contiguous range of rows and random picks are O(1)
+class DatasetIndex:
+    def __init__(self, split, names, labels, offsets, starts):
+        self.split = split
+        self.names = names
+        self.labels = labels
+        self.offsets = offsets
+        self.starts = starts
+        self._cache = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    # Row range of one label, or of all samples
+    def rows(self, label=None):
+        if label is None:
+            return range(len(self))
+        return range(int(self.starts[label]), int(self.starts[label + 1]))
+
+    def random_row(self, label=None, rng=random):
+        rows = self.rows(label)
+        if not len(rows):
+            raise LookupError(f"No samples with label {label} in '{self.split}'.")
+        return rows[rng.randrange(len(rows))]
+
+    # count distinct random rows, sorted so the reads from the cache stay sequential
+    def sample(self, count, label=None, rng=None):
+        rows = self.rows(label)
+        count = min(count, len(rows))
+        picks = (rng or np.random.default_rng()).choice(len(rows), count, replace=False)
+        return np.sort(picks) + rows.start
+
+    def path(self, row):
+        return os.path.join(data_dir, self.split, str(int(self.labels[row])), self.names[row].decode())
+
+    # Pixels of one row or an array of rows as uint8, read through the byte offsets into the cache
+    def pixels(self, rows):
+        if self._cache is None:
+            self._cache = np.memmap(cache_paths(self.split)[0], dtype=np.uint8, mode="r")
+        starts = np.asarray(self.offsets[rows])
+        return self._cache[starts[..., None] + np.arange(784)]
+
+# The index carries the fingerprint of the cache it was built from, it is only valid while both match the files
+def write_index(split, index, meta):
+    path = index_path(split)
+    tmp_path = temporary_path(path)
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f, names=index.names, labels=index.labels, offsets=index.offsets, starts=index.starts,
+            meta=np.array(json.dumps(meta, sort_keys=True)),
+        )
+    os.replace(tmp_path, path)
+
+def read_index(split, meta):
+    if read_cache_meta(split) != meta:
+        return None
+    try:
+        with np.load(index_path(split)) as data:
+            if str(data['meta']) != json.dumps(meta, sort_keys=True):
+                return None
+            return DatasetIndex(split, data['names'], data['labels'], data['offsets'], data['starts'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def directory_mtimes(split):
+    return tuple(os.stat(os.path.join(data_dir, split, str(i))).st_mtime_ns for i in range(10))
+
+# Indexes this process already loaded, with the class directory mtimes and cache fingerprint they were checked against
+loaded_indexes = {}
+
+# Returns the DatasetIndex of a split, rebuilding it (and the decoded cache) only when the files changed.
+# The first call in a process stats every file, later calls keep the loaded index while the ten class directories
+# and the cache fingerprint stay the same. refresh=True checks every file again, e.g. after PNGs were rewritten in place
+def load_index(split="train", workers=None, refresh=False):
+    key = (data_dir, cache_dir, split)
+    directories = directory_mtimes(split)
+    if key in loaded_indexes and not refresh:
+        index, checked, meta = loaded_indexes[key]
+        if checked == directories and read_cache_meta(split) == meta:
+            return index
+
+    # The directories are listed once, that listing is both the fingerprint and the rows of a rebuilt index
+    files = list_images(split)
+    meta = fingerprint(files)
+    index = read_index(split, meta)
+    if index is None:
+        index = build_index(split, files, meta, workers)
+    loaded_indexes[key] = (index, directories, meta)
+    return index
+
+def build_index(split, files, meta, workers=None):
+    images, labels = load_files(split, files, meta, workers)
+    labels = np.asarray(labels)
+    index = DatasetIndex(
+        split,
+        np.array([entry.name.encode() for _, entry in files], dtype=np.bytes_),
+        labels.copy(),
+        images.offset + np.arange(len(files), dtype=np.int64) * 784,
+        np.searchsorted(labels, np.arange(11)).astype(np.int64),
+    )
+    write_index(split, index, meta)
+    return index
+
+# Yields shuffled (X, y) mini-batches, pixels stay uint8 until a batch is normalized
+def iter_batches(images, labels, batch_size=32, order=None, start=0, rng=None):
+    if order is None:
+        order = (rng or np.random.default_rng()).permutation(len(images))
+
+    for offset in range(start, len(order), batch_size):
+        batch = np.sort(order[offset:offset + batch_size])
+        X = images[batch].astype(np.float32)
+        X /= 255.0
+        yield X, labels[batch].astype(np.int64)
+
+def load_trainings_data():
+    images, labels = load_dataset("train")
+
+    data_matrix = []
+    for label, pixels in zip(labels, images):
+        data_matrix.append([int(label), *(pixels / 255.0).tolist()])
 
-            data_matrix.append([i, *pixels])
-            loaded += 1
-            if loaded % 1000 == 0 or loaded == total:
-                print(f"Loaded {loaded}/{total}")
-        
     return data_matrix
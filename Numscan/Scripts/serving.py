@@ -0,0 +1,193 @@
+
+# This file holds the model loading, preprocessing and prediction helpers shared by the Discord bot and the HTTP server
+
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import dotenv_values
+from PIL import Image
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+NUMSCAN_DIR = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+PROJECT_DIR = os.path.abspath(os.path.join(NUMSCAN_DIR, ".."))
+NUMSCAN2_DIR = os.path.join(PROJECT_DIR, "Numscan 2")
+for path in (NUMSCAN2_DIR, PROJECT_DIR, NUMSCAN_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from network import nn
+from shared_model import SharedModelPublisher, SharedModelReader
+import preprocess
+import Numscan.Scripts.Test.predict as predict
+from engine import CnnEngine
+
+DOTENV_CANDIDATES = [
+    os.path.join(PROJECT_DIR, ".env"),
+    os.path.join(PROJECT_DIR, "Discord Bot", ".env"),
+]
+
+def load_env_file(dotenv_path: str) -> None:
+    with open(dotenv_path, "r", encoding="utf-8-sig") as handle:
+        values = dotenv_values(stream=handle)
+    for key, value in values.items():
+        if value is None:
+            continue
+        os.environ[key] = value
+
+
+def load_env(candidates: List[str] = DOTENV_CANDIDATES) -> None:
+    for dotenv_path in candidates:
+        if os.path.exists(dotenv_path):
+            load_env_file(dotenv_path)
+
+
+# The trained Numscan 1 model in both formats, the most recently written one first
+def numscan_model_candidates() -> List[str]:
+    paths = [
+        os.path.join(NUMSCAN_DIR, "Models", "after.nsm"),
+        os.path.join(NUMSCAN_DIR, "Models", "after.pickle"),
+    ]
+    return sorted(paths, key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0, reverse=True)
+
+
+def model_candidates() -> List[Optional[str]]:
+    return [
+        os.getenv("MNIST_MODEL_PATH"),
+        *numscan_model_candidates(),
+        os.path.join(PROJECT_DIR, "Numscan 2", "Models", "model.pkl"),
+    ]
+
+
+def model_checksum(model_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Set when the loaded model is the Numscan 2 CNN, which then runs on the NumPy engine
+cnn: Optional[CnnEngine] = None
+
+# The process pool parent publishes the dense model into shared memory, every worker attaches a reader to it
+shared_model: Optional[SharedModelPublisher] = None
+shared_reader: Optional[SharedModelReader] = None
+
+
+def load_model(model_path: str) -> str:
+    global cnn
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file '{model_path}' not found.")
+    data = None
+    if os.path.splitext(model_path)[1].lower() in (".pkl", ".pickle"):
+        with open(model_path, "rb") as handle:
+            data = pickle.load(handle)
+    if isinstance(data, list):
+        cnn = CnnEngine(data)
+    else:
+        nn.load(model_path)
+        nn.to_numpy()
+        cnn = None
+    logging.info("Loaded model parameters from %s", model_path)
+    return model_checksum(model_path)
+
+
+def attach_shared_model(control_name: str) -> None:
+    global shared_reader, cnn
+    shared_reader = SharedModelReader(control_name)
+    shared_reader.refresh(nn)
+    cnn = None
+
+
+# Picks up a model the parent swapped in since the last call, only a few bytes are read when nothing changed
+def refresh_shared_model() -> None:
+    if shared_reader is not None:
+        shared_reader.refresh(nn)
+
+
+# Loads a new model in the parent and swaps it in for all workers at once, needs the shared process pool
+def reload_model(model_path: str) -> str:
+    global cnn
+    if shared_model is None:
+        raise RuntimeError("Reloading needs the process executor with a Numscan 1 model.")
+    checksum = load_model(model_path)
+    if cnn is not None:
+        cnn = None
+        raise ValueError("The shared process pool serves Numscan 1 models only.")
+    version = shared_model.publish(nn)
+    logging.info("Published model version %d from %s", version, model_path)
+    return checksum
+
+
+def resolve_model_path(candidates: List[str]) -> str:
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    missing_list = ", ".join(path for path in candidates if path)
+    raise FileNotFoundError(f"Model file not found. Checked: {missing_list}")
+
+
+def preprocess_image(image: Image.Image, normalize: bool = False) -> np.ndarray:
+    return preprocess.image_to_vector(image, normalize)
+
+
+def preprocess_bytes(data: bytes, normalize: bool = False) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as img:
+        return preprocess_image(img, normalize)
+
+
+def predict_digit(vector: List[float]) -> Tuple[int, float]:
+    refresh_shared_model()
+    if cnn is not None:
+        return predict_digits([vector])[0]
+    _, layer_outputs = predict.exec(vector)
+    logits = layer_outputs[-1]
+    probabilities = predict.soft_max(logits)
+    digit = max(range(len(probabilities)), key=lambda idx: probabilities[idx])
+    confidence = float(probabilities[digit])
+    return digit, confidence
+
+
+def predict_probabilities(vectors: List[List[float]]) -> np.ndarray:
+    refresh_shared_model()
+    if cnn is not None:
+        return cnn.predict(np.asarray(vectors, dtype=np.float32).reshape(-1, 28, 28, 1))
+    _, probabilities, _ = predict.predict_batch(np.asarray(vectors, dtype=np.float32))
+    return probabilities
+
+
+def predict_digits(vectors: List[List[float]]) -> List[Tuple[int, float]]:
+    probabilities = predict_probabilities(vectors)
+    digits = probabilities.argmax(axis=1)
+    return [(int(digit), float(probs[digit])) for digit, probs in zip(digits, probabilities)]
+
+
+# Expects load_model(model_path) to have run in this process already
+def create_executor(kind: str, workers: Optional[int], model_path: str) -> Executor:
+    global shared_model
+    if kind == "process":
+        if cnn is not None:
+            # The CNN has no shared memory layout, every worker process loads its own copy
+            return ProcessPoolExecutor(max_workers=workers, initializer=load_model, initargs=(model_path,))
+        # Workers map the one published copy read-only, so memory stays flat with more workers
+        shared_model = SharedModelPublisher()
+        shared_model.publish(nn)
+        return ProcessPoolExecutor(max_workers=workers, initializer=attach_shared_model, initargs=(shared_model.name,))
+    if kind != "thread":
+        raise ValueError(f"MNIST_EXECUTOR must be 'thread' or 'process', got '{kind}'.")
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="numscan")
+
+
+def shutdown_executor(executor: Executor) -> None:
+    global shared_model
+    executor.shutdown(wait=False, cancel_futures=True)
+    if shared_model is not None:
+        shared_model.close()
+        shared_model = None
@@ -1,15 +1,32 @@
 import json
+import mmap
+import os
 import pickle
 import random
 import math
+import struct
+import zlib
+
+import numpy as np
+
+# Binary model header: magic, version, dtype code, number of layers, crc32 of the payload, followed by the layer sizes
+BINARY_MAGIC = b"NSCN"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHII")
+BINARY_DTYPES = {1: np.dtype("<f4")}
 
 class NeuralNetworkStorage:
     def __init__(self, *layer_sizes):
+        self.reset(*layer_sizes)
+
+    # Starts over with freshly initialized parameters, works on the shared nn instance in place
+    def reset(self, *layer_sizes):
         self.layer_sizes = layer_sizes
         self.num_layers = len(layer_sizes)
         
         self.weights = []
         self.biases = []
+        self.is_numpy = False
         
         self._initialize_parameters()
     
@@ -45,12 +62,40 @@ class NeuralNetworkStorage:
     def set_biases(self, layer_index, bias_vector):
         self.biases[layer_index] = bias_vector
 
-    def save_to_json(self, filename):
-        data = {
+    # Switches the storage to contiguous float32 ndarrays, used by the vectorized predict path
+    def to_numpy(self, copy=False):
+        convert = np.array if copy else np.ascontiguousarray
+        self.weights = [convert(w, dtype=np.float32) for w in self.weights]
+        self.biases = [convert(b, dtype=np.float32) for b in self.biases]
+        self.is_numpy = True
+
+    # Switches the storage back to nested python lists
+    def to_lists(self):
+        self.weights = [np.asarray(w, dtype=np.float64).tolist() for w in self.weights]
+        self.biases = [np.asarray(b, dtype=np.float64).tolist() for b in self.biases]
+        self.is_numpy = False
+
+    def _data(self):
+        weights, biases = self.weights, self.biases
+        if self.is_numpy:
+            weights = [w.astype(np.float64).tolist() for w in weights]
+            biases = [b.astype(np.float64).tolist() for b in biases]
+        return {
             'layer_sizes': self.layer_sizes,
-            'weights': self.weights,
-            'biases': self.biases
+            'weights': weights,
+            'biases': biases
         }
+
+    def _set_data(self, data):
+        self.layer_sizes = data['layer_sizes']
+        self.weights = data['weights']
+        self.biases = data['biases']
+        self.num_layers = len(self.layer_sizes)
+        if self.is_numpy:
+            self.to_numpy()
+
+    def save_to_json(self, filename):
+        data = self._data()
         
         with open(filename, 'w') as f:
             json.dump(data, f, indent=2)
@@ -59,17 +104,10 @@ class NeuralNetworkStorage:
         with open(filename, 'r') as f:
             data = json.load(f)
         
-        self.layer_sizes = data['layer_sizes']
-        self.weights = data['weights']
-        self.biases = data['biases']
-        self.num_layers = len(self.layer_sizes)
+        self._set_data(data)
     
     def save_to_pickle(self, filename):
-        data = {
-            'layer_sizes': self.layer_sizes,
-            'weights': self.weights,
-            'biases': self.biases
-        }
+        data = self._data()
         
         with open(filename, 'wb') as f:
             pickle.dump(data, f)
@@ -78,9 +116,81 @@ class NeuralNetworkStorage:
         with open(filename, 'rb') as f:
             data = pickle.load(f)
         
-        self.layer_sizes = data['layer_sizes']
-        self.weights = data['weights']
-        self.biases = data['biases']
-        self.num_layers = len(self.layer_sizes)
-    
+        self._set_data(data)
+
+    def _payload_size(self, layer_sizes):
+        return sum((n_in + 1) * n_out for n_in, n_out in zip(layer_sizes[:-1], layer_sizes[1:]))
+
+    # Points weights and biases at float32 views of one flat buffer, laid out as W0, b0, W1, b1, ...
+    def _bind_buffer(self, buffer, layer_sizes, offset=0):
+        weights = []
+        biases = []
+        for n_in, n_out in zip(layer_sizes[:-1], layer_sizes[1:]):
+            weights.append(np.frombuffer(buffer, dtype="<f4", count=n_in * n_out, offset=offset).reshape(n_out, n_in))
+            offset += n_in * n_out * 4
+            biases.append(np.frombuffer(buffer, dtype="<f4", count=n_out, offset=offset))
+            offset += n_out * 4
+
+        self.layer_sizes = tuple(layer_sizes)
+        self.num_layers = len(layer_sizes)
+        self.weights = weights
+        self.biases = biases
+        self.is_numpy = True
+
+    def _payload_bytes(self):
+        parts = []
+        for w, b in zip(self.weights, self.biases):
+            parts.append(np.ascontiguousarray(w, dtype="<f4").tobytes())
+            parts.append(np.ascontiguousarray(b, dtype="<f4").tobytes())
+        return b"".join(parts)
+
+    # Header, layer sizes and payload of the binary format, as written to .nsm files and shared memory
+    def _binary_bytes(self):
+        payload = self._payload_bytes()
+        layer_sizes = [int(size) for size in self.layer_sizes]
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 1, len(layer_sizes), zlib.crc32(payload))
+        return header + struct.pack(f"<{len(layer_sizes)}I", *layer_sizes) + payload
+
+    # Points weights and biases at the payload of a buffer in the binary format, without copying
+    def _bind_binary(self, buffer, verify=True, source="buffer"):
+        magic, version, dtype_code, num_layers, checksum = BINARY_HEADER.unpack_from(buffer, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION or dtype_code not in BINARY_DTYPES:
+            raise ValueError(f"'{source}' is not a Numscan binary model.")
+
+        layer_sizes = struct.unpack_from(f"<{num_layers}I", buffer, BINARY_HEADER.size)
+        offset = BINARY_HEADER.size + 4 * num_layers
+        end = offset + 4 * self._payload_size(layer_sizes)
+        if len(buffer) < end:
+            raise ValueError(f"'{source}' has an unexpected size.")
+        if verify and zlib.crc32(memoryview(buffer)[offset:end]) != checksum:
+            raise ValueError(f"Checksum mismatch in '{source}'.")
+
+        self._bind_buffer(buffer, layer_sizes, offset)
+        return end
+
+    # Written next to the target and swapped in, processes that still map the old file keep reading the old one
+    def save_to_binary(self, filename):
+        tmp_path = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._binary_bytes())
+        os.replace(tmp_path, filename)
+
+    # Maps the file read-only, the weights are zero-copy views into the mapping
+    def load_from_binary(self, filename, verify=True):
+        with open(filename, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._bind_binary(buffer, verify, filename) != len(buffer):
+            raise ValueError(f"'{filename}' has an unexpected size.")
+
+    # Picks the loader from the file extension: .json, .pickle/.pkl or the binary format
+    def load(self, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".json":
+            self.load_from_json(filename)
+        elif extension in (".pickle", ".pkl"):
+            self.load_from_pickle(filename)
+        else:
+            self.load_from_binary(filename)
+
 nn = NeuralNetworkStorage(784, 128, 128, 10)
\ No newline at end of file
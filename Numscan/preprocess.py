@@ -0,0 +1,72 @@
+
+# This file turns images into 28x28 pixel arrays for the networks, shared by the loader, the editor and the bot
+
+import numpy as np
+from PIL import Image
+
+GRID_SIZE = 28
+FIT_SIZE = 20
+EXPECTED_SIZE = (GRID_SIZE, GRID_SIZE)
+
+try:
+    RESAMPLE_MODE = Image.Resampling.LANCZOS
+except AttributeError:
+    RESAMPLE_MODE = Image.ANTIALIAS
+
+# MNIST style: crop to the bounding box, fit into 20x20 and move the center of mass to the middle of 28x28
+def mnist_normalize(pixels, threshold=0):
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    rows = np.flatnonzero(pixels.max(axis=1) > threshold)
+    cols = np.flatnonzero(pixels.max(axis=0) > threshold)
+    if not len(rows):
+        return np.zeros(EXPECTED_SIZE, dtype=np.uint8)
+
+    crop = pixels[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    height, width = crop.shape
+    scale = FIT_SIZE / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    small = np.asarray(Image.fromarray(crop).resize(size, RESAMPLE_MODE), dtype=np.uint8)
+
+    weights = small.astype(np.float64)
+    total = weights.sum() or 1.0
+    center_y = (weights.sum(axis=1) * np.arange(small.shape[0])).sum() / total
+    center_x = (weights.sum(axis=0) * np.arange(small.shape[1])).sum() / total
+
+    middle = (GRID_SIZE - 1) / 2
+    top = min(max(int(round(middle - center_y)), 0), GRID_SIZE - small.shape[0])
+    left = min(max(int(round(middle - center_x)), 0), GRID_SIZE - small.shape[1])
+
+    result = np.zeros(EXPECTED_SIZE, dtype=np.uint8)
+    result[top:top + small.shape[0], left:left + small.shape[1]] = small
+    return result
+
+# Grayscale 28x28 PIL image, images that already are one are used as they are
+def grid_image(image):
+    grayscale = image if image.mode == "L" else image.convert("L")
+    if grayscale.size != EXPECTED_SIZE:
+        grayscale = grayscale.resize(EXPECTED_SIZE, RESAMPLE_MODE)
+    return grayscale
+
+def image_to_pixels(image, normalize=False):
+    if normalize:
+        return mnist_normalize(np.asarray(image.convert("L"), dtype=np.uint8))
+    return np.asarray(grid_image(image), dtype=np.uint8)
+
+# Returns an (N, 784) uint8 array for a list of images.
+# Converting and resizing is PIL work per image, without normalization the raw bytes are joined and read as one array
+def images_to_uint8(images, normalize=False):
+    if normalize:
+        grids = [image_to_pixels(image, True) for image in images]
+        pixels = np.stack(grids) if grids else np.empty(0, dtype=np.uint8)
+    else:
+        pixels = np.frombuffer(bytearray().join(grid_image(image).tobytes() for image in images), dtype=np.uint8)
+    return pixels.reshape(len(images), GRID_SIZE * GRID_SIZE)
+
+# Returns an (N, 784) float32 array in [0, 1] for a list of images
+def images_to_vectors(images, normalize=False):
+    vectors = images_to_uint8(images, normalize).astype(np.float32)
+    vectors /= 255.0
+    return vectors
+
+def image_to_vector(image, normalize=False):
+    return images_to_vectors([image], normalize)[0]
@@ -0,0 +1,91 @@
+
+# This file quantizes the layers of a NeuralNetworkStorage to int8 with one scale per weight row
+
+import numpy as np
+
+class QuantizedNetwork:
+    def __init__(self, layer_sizes, weights, scales, biases, input_scales=None):
+        self.layer_sizes = tuple(layer_sizes)
+        self.num_layers = len(layer_sizes)
+
+        # weights[i] is int8 (out, in), scales[i] float32 (out,), biases stay float32
+        self.weights = weights
+        self.scales = scales
+        self.biases = biases
+
+        # Fixed activation scale per layer input from calibration, None means a dynamic scale per batch
+        self.input_scales = input_scales
+
+    def get_weights(self, layer_index):
+        return self.weights[layer_index]
+
+    def get_scales(self, layer_index):
+        return self.scales[layer_index]
+
+    def get_biases(self, layer_index):
+        return self.biases[layer_index]
+
+    def get_input_scale(self, layer_index):
+        if self.input_scales is None:
+            return None
+        return self.input_scales[layer_index]
+
+    def nbytes(self):
+        return sum(w.nbytes + s.nbytes + b.nbytes for w, s, b in zip(self.weights, self.scales, self.biases))
+
+    def save(self, filename):
+        arrays = {'layer_sizes': np.asarray(self.layer_sizes, dtype=np.int64)}
+        for i in range(self.num_layers - 1):
+            arrays[f'w{i}'] = self.weights[i]
+            arrays[f's{i}'] = self.scales[i]
+            arrays[f'b{i}'] = self.biases[i]
+        if self.input_scales is not None:
+            arrays['input_scales'] = np.asarray(self.input_scales, dtype=np.float32)
+
+        with open(filename, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            layer_sizes = data['layer_sizes'].tolist()
+            layers = range(len(layer_sizes) - 1)
+            input_scales = data['input_scales'].tolist() if 'input_scales' in data else None
+            return cls(
+                layer_sizes,
+                [data[f'w{i}'] for i in layers],
+                [data[f's{i}'] for i in layers],
+                [data[f'b{i}'] for i in layers],
+                input_scales,
+            )
+
+def quantize_matrix(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+# Largest absolute activation entering each layer, measured on a float32 forward pass over X
+def calibrate(network, X):
+    a = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+    maxima = []
+    for i in range(network.num_layers - 1):
+        maxima.append(float(np.abs(a).max()) if a.size else 1.0)
+        weights = np.asarray(network.get_weights(i), dtype=np.float32)
+        biases = np.asarray(network.get_biases(i), dtype=np.float32)
+        a = np.maximum(a @ weights.T + biases, 0)
+    return [(m or 1.0) / 127.0 for m in maxima]
+
+def quantize(network, calibration=None):
+    weights = []
+    scales = []
+    biases = []
+    for i in range(network.num_layers - 1):
+        quantized, row_scales = quantize_matrix(network.get_weights(i))
+        weights.append(quantized)
+        scales.append(row_scales)
+        biases.append(np.asarray(network.get_biases(i), dtype=np.float32))
+
+    input_scales = calibrate(network, calibration) if calibration is not None else None
+    return QuantizedNetwork(network.layer_sizes, weights, scales, biases, input_scales)
@@ -0,0 +1,96 @@
+
+# This file publishes a NeuralNetworkStorage into shared memory, so worker processes share one read-only copy of the weights
+
+import struct
+from multiprocessing import shared_memory
+
+# Control block: sequence counter, version and name of the segment that holds the current model.
+# The sequence is odd while the publisher writes, readers retry until they see the same even value twice
+CONTROL = struct.Struct("<QQ64s")
+
+class SharedModelPublisher:
+    def __init__(self):
+        self.control = shared_memory.SharedMemory(create=True, size=CONTROL.size)
+        self.control.buf[:CONTROL.size] = CONTROL.pack(0, 0, b"")
+        self.segment = None
+        self.version = 0
+
+    @property
+    def name(self):
+        return self.control.name
+
+    # Copies the network into a new segment and points the control block at it, returns the new version
+    def publish(self, network):
+        data = network._binary_bytes()
+        segment = shared_memory.SharedMemory(create=True, size=len(data))
+        segment.buf[:len(data)] = data
+
+        self.version += 1
+        sequence = struct.unpack_from("<Q", self.control.buf, 0)[0]
+        struct.pack_into("<Q", self.control.buf, 0, sequence + 1)
+        struct.pack_into("<Q64s", self.control.buf, 8, self.version, segment.name.encode())
+        struct.pack_into("<Q", self.control.buf, 0, sequence + 2)
+
+        # Workers that still map the old version keep their mapping, the name just goes away
+        old, self.segment = self.segment, segment
+        if old is not None:
+            old.close()
+            old.unlink()
+        return self.version
+
+    def close(self):
+        for shm in (self.segment, self.control):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.segment = None
+
+class SharedModelReader:
+    def __init__(self, control_name):
+        self.control = shared_memory.SharedMemory(name=control_name)
+        self.segment = None
+        self.version = 0
+        self.retired = []
+
+    def current(self):
+        while True:
+            sequence, version, name = CONTROL.unpack_from(self.control.buf, 0)
+            if sequence % 2 == 0 and struct.unpack_from("<Q", self.control.buf, 0)[0] == sequence:
+                return version, name.rstrip(b"\0").decode()
+
+    # Binds network to the newest published version, a cheap check when nothing changed
+    def refresh(self, network):
+        version, name = self.current()
+        if version == self.version:
+            return False
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            # Replaced again while attaching, the next call picks up the newer one
+            return False
+
+        network._bind_binary(segment.buf.toreadonly(), verify=False, source=name)
+        if self.segment is not None:
+            self.retired.append(self.segment)
+        self.segment = segment
+        self.version = version
+        self._close_retired()
+        return True
+
+    # Old segments can only be closed once no array points into them anymore
+    def _close_retired(self):
+        still_used = []
+        for segment in self.retired:
+            try:
+                segment.close()
+            except BufferError:
+                still_used.append(segment)
+        self.retired = still_used
+
+    def close(self):
+        for segment in self.retired + [self.segment, self.control]:
+            if segment is not None:
+                try:
+                    segment.close()
+                except BufferError:
+                    pass
@@ -0,0 +1,115 @@
+
+# This file holds opt-in timers, a throttled progress reporter and a JSONL metric writer for prediction and training
+
+import contextlib
+import json
+import time
+from collections import defaultdict
+
+# Everything is off by default, timer() then hands out one shared no-op context
+enabled = False
+totals = defaultdict(float)
+counts = defaultdict(int)
+writer = None
+
+_NULL_TIMER = contextlib.nullcontext()
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        totals[self.name] += time.perf_counter() - self.start
+        counts[self.name] += 1
+        return False
+
+def timer(name):
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+# Same as timer(f"{prefix}.layer{layer}"), but the name is only built while telemetry is on
+def layer_timer(prefix, layer):
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(f"{prefix}.layer{layer}")
+
+class MetricWriter:
+    def __init__(self, filename):
+        self.file = open(filename, 'a')
+
+    def write(self, kind, **values):
+        self.file.write(json.dumps({'time': time.time(), 'kind': kind, **values}) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def enable(metrics_path=None):
+    global enabled, writer
+    enabled = True
+    if metrics_path and writer is None:
+        writer = MetricWriter(metrics_path)
+
+def disable():
+    global enabled, writer
+    enabled = False
+    if writer:
+        writer.close()
+        writer = None
+
+def reset():
+    totals.clear()
+    counts.clear()
+
+def summary():
+    return {
+        name: {'calls': counts[name], 'seconds': totals[name], 'ms_per_call': totals[name] * 1000 / counts[name]}
+        for name in sorted(totals)
+    }
+
+def print_summary():
+    for name, values in summary().items():
+        print(f"{name:32} {values['calls']:>9} calls {values['seconds']:>10.3f} s {values['ms_per_call']:>10.4f} ms/call")
+    if writer:
+        writer.write("timers", timers=summary())
+
+# Prints samples/sec, running loss and ETA at most once every `every` seconds
+class ProgressReporter:
+    def __init__(self, total, every=5.0, metrics=None, label="Train", smoothing=0.98):
+        self.total = total
+        self.every = every
+        self.metrics = metrics
+        self.label = label
+        self.smoothing = smoothing
+        self.done = 0
+        self.loss = None
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, samples, loss=None):
+        self.done += samples
+        if loss is not None:
+            self.loss = loss if self.loss is None else self.smoothing * self.loss + (1 - self.smoothing) * loss
+
+        now = time.perf_counter()
+        if now - self.last_report >= self.every or self.done >= self.total:
+            self.report(now)
+
+    def report(self, now=None):
+        now = now or time.perf_counter()
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0.0
+        loss = "-" if self.loss is None else f"{self.loss:.4f}"
+        print(f"{self.label}: {self.done}/{self.total} samples, {rate:.0f} samples/sec, loss {loss}, ETA {eta:.0f}s")
+        if self.metrics:
+            self.metrics.write("progress", label=self.label, done=self.done, total=self.total,
+                               samples_per_second=rate, loss=self.loss, eta=eta)
@@ -1,11 +1,13 @@
 
-# This file opens an editor for predicting drawn, loaded or random images using both numscan 1 and 2   !!! numscan 2 might take some while to load !!!
+# This file opens an editor for predicting drawn, loaded or random images using both numscan 1 and 2
 
 import importlib.util
 import os
-import random
+import queue
 import sys
+import time
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, messagebox
 
 import numpy as np
@@ -19,17 +21,20 @@ if base_dir not in sys.path:
 if numscan_dir not in sys.path:
     sys.path.insert(0, numscan_dir)
 
-data_dir = os.path.join(numscan_dir, "Data", "mnist-png")
-numscan_model_path = os.path.join(numscan_dir, "Models", "after.pickle")
 numscan2_model_path = os.path.join(numscan2_dir, "Models", "model.pkl")
-numscan2_model_module = os.path.join(numscan2_dir, "model.py")
+numscan2_engine_module = os.path.join(numscan2_dir, "engine.py")
 
-from Numscan.Scripts.Test.predict import exec as nn_exec, soft_max
+from Numscan.Scripts.Test.predict import IncrementalExec, soft_max
+from Numscan.Scripts.load import load_index
+from Numscan.Scripts.serving import numscan_model_candidates, resolve_model_path
 from network import nn
+from preprocess import image_to_vector
 
 CANVAS_SIZE = 280
 GRID_SIZE = 28
 STROKE_WIDTH = 18
+POLL_MS = 30
+LIVE_MS = 33
 
 
 class EditorApp:
@@ -41,6 +46,12 @@ class EditorApp:
         self.prev_y = None
         self.model_choice_var = tk.StringVar(value="numscan1")
         self.result_var = tk.StringVar(value="Prediction: -")
+        self.status_var = tk.StringVar(value="")
+        self.normalize_var = tk.BooleanVar(value=False)
+        self.live_var = tk.BooleanVar(value=False)
+        self.demo_label_var = tk.StringVar(value="Any")
+        self.live_after_id = None
+        self.numscan1_exec = IncrementalExec()
         self.numscan1_loaded = False
         self.numscan1_path = None
         self.numscan2_model = None
@@ -52,7 +63,17 @@ class EditorApp:
         self.img_hi = Image.new("L", (CANVAS_SIZE, CANVAS_SIZE), color=0)
         self.draw_hi = ImageDraw.Draw(self.img_hi)
 
+        # Model loading and prediction run on one worker thread, so they never overlap and never block Tk.
+        # Results come back through a queue that the main thread drains with after()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="editor-worker")
+        self.results = queue.Queue()
+        self.pending = 0
+
         self._build_ui()
+        self.model_choice_var.trace_add("write", lambda *_: self.warm_up())
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after(POLL_MS, self._poll_results)
+        self.root.after_idle(self.warm_up)
 
     def _build_ui(self):
         main = tk.Frame(self.root)
@@ -82,12 +103,20 @@ class EditorApp:
         tk.Radiobutton(model_frame, text="Numscan 1", variable=self.model_choice_var, value="numscan1").pack(anchor="w")
         tk.Radiobutton(model_frame, text="Numscan 2", variable=self.model_choice_var, value="numscan2").pack(anchor="w")
 
+        tk.Checkbutton(ctrl, text="Center digit (MNIST style)", variable=self.normalize_var).pack(anchor="w", pady=(0, 6))
+        tk.Checkbutton(ctrl, text="Live prediction", variable=self.live_var).pack(anchor="w", pady=(0, 6))
+
         tk.Button(ctrl, text="Predict", command=self.predict).pack(fill=tk.X, pady=(0, 6))
         tk.Button(ctrl, text="Clear", command=self.clear_canvas).pack(fill=tk.X, pady=(0, 6))
         tk.Button(ctrl, text="Load Image", command=self.load_image_dialog).pack(fill=tk.X, pady=(0, 6))
-        tk.Button(ctrl, text="Random Demo", command=self.load_random_demo).pack(fill=tk.X, pady=(0, 6))
+        demo_frame = tk.Frame(ctrl)
+        demo_frame.pack(fill=tk.X, pady=(0, 6))
+        tk.Button(demo_frame, text="Random Demo", command=self.load_random_demo).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.OptionMenu(demo_frame, self.demo_label_var, "Any", *[str(d) for d in range(10)]).pack(side=tk.LEFT)
         tk.Button(ctrl, text="Load Model", command=self.load_model_dialog).pack(fill=tk.X)
 
+        tk.Label(ctrl, textvariable=self.status_var, fg="#666", justify=tk.LEFT, wraplength=180).pack(anchor="w", pady=(8, 0))
+
     def _on_mouse_down(self, event):
         self.prev_x, self.prev_y = event.x, event.y
 
@@ -107,9 +136,24 @@ class EditorApp:
         )
         self.draw_hi.line([(self.prev_x, self.prev_y), (x, y)], fill=255, width=STROKE_WIDTH)
         self.prev_x, self.prev_y = x, y
+        self._schedule_live_prediction()
 
     def _on_mouse_up(self, _event):
         self.prev_x, self.prev_y = None, None
+        self._schedule_live_prediction()
+
+    # Coalesces the strokes of one frame into a single prediction
+    def _schedule_live_prediction(self):
+        if self.live_var.get() and self.live_after_id is None:
+            self.live_after_id = self.root.after(LIVE_MS, self._live_predict)
+
+    def _live_predict(self):
+        self.live_after_id = None
+        if self.pending:
+            # The worker is still busy, tries again next frame instead of queueing up stale images
+            self._schedule_live_prediction()
+            return
+        self.predict(live=True)
 
     def clear_canvas(self):
         self.canvas.delete("all")
@@ -147,29 +191,36 @@ class EditorApp:
         self._set_canvas_background_from_pil()
         self.result_var.set("Prediction: -")
 
+    # Picks through the dataset index. It is loaded once per session, later picks only re-check the class directories
     def load_random_demo(self):
-        base = os.path.join(data_dir, "train")
-        if not os.path.isdir(base):
-            messagebox.showinfo("Info", "Demo dataset not found at Numscan/Data/mnist-png/train.")
-            return
-        candidates = []
-        for d in range(10):
-            d_path = os.path.join(base, str(d))
-            if os.path.isdir(d_path):
-                for name in os.listdir(d_path):
-                    if name.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")):
-                        candidates.append(os.path.join(d_path, name))
-        if not candidates:
-            messagebox.showinfo("Info", "No images found in Numscan/Data/mnist-png/train.")
-            return
-        self._load_image(random.choice(candidates))
+        label = self.demo_label_var.get()
+        label = None if label == "Any" else int(label)
+
+        def pick():
+            index = load_index("train")
+            return index.path(index.random_row(label))
+
+        def done(path, error):
+            if isinstance(error, FileNotFoundError):
+                messagebox.showinfo("Info", "Demo dataset not found at Numscan/Data/mnist-png/train.")
+            elif isinstance(error, LookupError):
+                messagebox.showinfo("Info", "No images of that digit found in Numscan/Data/mnist-png/train.")
+            elif error is not None:
+                messagebox.showerror("Error", f"Failed to load demo image:\n{error}")
+            else:
+                try:
+                    self._load_image(path)
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to load image:\n{e}")
+
+        self._submit(pick, done)
 
     def _get_numscan2_module(self):
         if self.numscan2_module is not None:
             return self.numscan2_module
-        if not os.path.exists(numscan2_model_module):
-            raise FileNotFoundError(f"Numscan 2 module not found at '{numscan2_model_module}'.")
-        spec = importlib.util.spec_from_file_location("numscan2_model", numscan2_model_module)
+        if not os.path.exists(numscan2_engine_module):
+            raise FileNotFoundError(f"Numscan 2 module not found at '{numscan2_engine_module}'.")
+        spec = importlib.util.spec_from_file_location("numscan2_engine", numscan2_engine_module)
         if spec is None or spec.loader is None:
             raise ImportError("Failed to load Numscan 2 model module.")
         module = importlib.util.module_from_spec(spec)
@@ -179,8 +230,9 @@ class EditorApp:
 
     def _load_numscan1(self, path: str):
         if not os.path.exists(path):
-            raise FileNotFoundError(f"Pickle file '{path}' does not exist.")
-        nn.load_from_pickle(path)
+            raise FileNotFoundError(f"Model file '{path}' does not exist.")
+        nn.load(path)
+        nn.to_numpy()
         self.numscan1_loaded = True
         self.numscan1_path = path
 
@@ -188,52 +240,136 @@ class EditorApp:
         if not os.path.exists(path):
             raise FileNotFoundError(f"Pickle file '{path}' does not exist.")
         module = self._get_numscan2_module()
-        self.numscan2_model = module.load_model_pickle(path)
+        self.numscan2_model = module.CnnEngine.load(path)
         self.numscan2_path = path
 
-    def _ensure_model_loaded(self):
-        choice = self.model_choice_var.get()
+    # Runs on the worker thread, returns the load time in seconds or None if the model was already loaded
+    def _ensure_model_loaded(self, choice):
+        start = time.perf_counter()
         if choice == "numscan2":
-            if self.numscan2_model is None:
-                self._load_numscan2(self.numscan2_path or numscan2_model_path)
+            if self.numscan2_model is not None:
+                return None
+            self._load_numscan2(self.numscan2_path or numscan2_model_path)
         else:
-            if not self.numscan1_loaded:
-                self._load_numscan1(self.numscan1_path or numscan_model_path)
+            if self.numscan1_loaded:
+                return None
+            # Same choice as the bot and the server: the newer of after.nsm and after.pickle
+            self._load_numscan1(self.numscan1_path or resolve_model_path(numscan_model_candidates()))
+        return time.perf_counter() - start
 
     def _prepare_input_vector(self):
-        small = self.img_hi.resize((GRID_SIZE, GRID_SIZE), Image.LANCZOS)
-        return [p / 255.0 for p in small.getdata()]
+        return image_to_vector(self.img_hi, self.normalize_var.get())
+
+    def _model_name(self, choice):
+        return "Numscan 2" if choice == "numscan2" else "Numscan 1"
+
+    # Runs job on the worker thread and hands (result, error) to on_done on the Tk thread
+    def _submit(self, job, on_done):
+        def run():
+            try:
+                self.results.put((on_done, job(), None))
+            except Exception as e:
+                self.results.put((on_done, None, e))
+
+        self.pending += 1
+        self.executor.submit(run)
+
+    def _poll_results(self):
+        while True:
+            try:
+                on_done, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            on_done(result, error)
+        self.root.after(POLL_MS, self._poll_results)
+
+    def warm_up(self):
+        choice = self.model_choice_var.get()
+        name = self._model_name(choice)
+        self.status_var.set(f"Loading {name}...")
+
+        def done(load_seconds, error):
+            if error is not None:
+                self.status_var.set(f"{name} failed to load: {error}")
+            elif load_seconds is not None:
+                self.status_var.set(f"{name} loaded in {load_seconds * 1000:.0f} ms")
+            elif self.pending == 0:
+                self.status_var.set(f"{name} ready")
+
+        self._submit(lambda: self._ensure_model_loaded(choice), done)
+
+    def _run_prediction(self, choice, X):
+        load_seconds = self._ensure_model_loaded(choice)
+        start = time.perf_counter()
+        if choice == "numscan2":
+            batch = np.array(X, dtype="float32").reshape(1, GRID_SIZE, GRID_SIZE, 1)
+            probs = self.numscan2_model.predict(batch, verbose=0)[0]
+        else:
+            # Only the first layer columns of the pixels that changed since the last prediction are recomputed
+            _, z = self.numscan1_exec.exec(X)
+            probs = soft_max(z[-1])
+        return int(np.argmax(probs)), load_seconds, time.perf_counter() - start
 
-    def predict(self):
+    def predict(self, live=False):
         try:
-            self._ensure_model_loaded()
             X = self._prepare_input_vector()
-            if self.model_choice_var.get() == "numscan2":
-                batch = np.array(X, dtype="float32").reshape(1, GRID_SIZE, GRID_SIZE, 1)
-                probs = self.numscan2_model.predict(batch, verbose=0)[0].tolist()
-            else:
-                _, z = nn_exec(X)
-                logits = z[-1]
-                probs = soft_max(logits)
-            pred = max(range(10), key=lambda i: probs[i])
-            self.result_var.set(f"Prediction: {pred}")
         except Exception as e:
             messagebox.showerror("Error", f"Prediction failed:\n{e}")
+            return
+        choice = self.model_choice_var.get()
+        name = self._model_name(choice)
+        if not live:
+            self.result_var.set("Prediction: ...")
+
+        def done(result, error):
+            if error is not None:
+                self.result_var.set("Prediction: -")
+                if live:
+                    self.status_var.set(f"Live prediction failed: {error}")
+                else:
+                    messagebox.showerror("Error", f"Prediction failed:\n{error}")
+                return
+            pred, load_seconds, infer_seconds = result
+            self.result_var.set(f"Prediction: {pred}")
+            status = f"{name} inference: {infer_seconds * 1000:.2f} ms"
+            if load_seconds is not None:
+                status = f"{name} loaded in {load_seconds * 1000:.0f} ms\n{status}"
+            self.status_var.set(status)
+
+        self._submit(lambda: self._run_prediction(choice, X), done)
 
     def load_model_dialog(self):
         title = "Open model weights"
-        filetypes = [("Pickle files", "*.pickle;*.pkl"), ("All files", "*.*")]
+        filetypes = [("Model files", "*.pickle;*.pkl;*.nsm"), ("All files", "*.*")]
         path = filedialog.askopenfilename(title=title, filetypes=filetypes)
         if not path:
             return
-        try:
-            if self.model_choice_var.get() == "numscan2":
+        choice = self.model_choice_var.get()
+        name = self._model_name(choice)
+        self.status_var.set(f"Loading {name} from {os.path.basename(path)}...")
+
+        def load():
+            start = time.perf_counter()
+            if choice == "numscan2":
                 self._load_numscan2(path)
             else:
                 self._load_numscan1(path)
+            return time.perf_counter() - start
+
+        def done(load_seconds, error):
+            if error is not None:
+                self.status_var.set(f"{name} failed to load")
+                messagebox.showerror("Error", f"Failed to load model:\n{error}")
+                return
+            self.status_var.set(f"{name} loaded in {load_seconds * 1000:.0f} ms")
             messagebox.showinfo("Model Loaded", f"Loaded parameters from:\n{path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load model:\n{e}")
+
+        self._submit(load, done)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
 
 def main():
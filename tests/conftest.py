@@ -0,0 +1,56 @@
+
+# This file sets up the import paths of the scripts and the shared fixtures of the tests
+
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+fixed_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+numscan_path = os.path.join(fixed_path, "Numscan")
+script_path = os.path.join(numscan_path, "Scripts")
+
+for path in (
+    fixed_path,
+    numscan_path,
+    script_path,
+    os.path.join(script_path, "Test"),
+    os.path.join(script_path, "Train"),
+    os.path.join(fixed_path, "Numscan 2"),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import load
+from network import nn
+
+# Random PNG tree in the layout of mnist-png, samples_per_label images per digit and split
+@pytest.fixture
+def png_tree(tmp_path, monkeypatch, samples_per_label=6):
+    rng = np.random.default_rng(0)
+    data_dir = tmp_path / "mnist-png"
+    for split in ("train", "test"):
+        for label in range(10):
+            class_dir = data_dir / split / str(label)
+            class_dir.mkdir(parents=True)
+            for i in range(samples_per_label):
+                pixels = rng.integers(0, 256, (28, 28), dtype=np.uint8)
+                Image.fromarray(pixels).save(class_dir / f"{i}.png")
+
+    monkeypatch.setattr(load, "data_dir", str(data_dir))
+    monkeypatch.setattr(load, "cache_dir", str(tmp_path / "cache"))
+    return data_dir
+
+# Seeded small network on the shared nn instance, the original weights are put back afterwards
+@pytest.fixture
+def small_network():
+    saved = dict(vars(nn))
+    random.seed(0)
+    nn.reset(784, 16, 12, 10)
+    nn.to_numpy()
+    yield nn
+    vars(nn).clear()
+    vars(nn).update(saved)
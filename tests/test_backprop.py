@@ -0,0 +1,55 @@
+
+# This file checks the vectorized batch gradients against finite differences of the mean cross entropy
+
+import numpy as np
+
+from network import nn
+from train import back_propagation_batch, batch_gradients
+
+def tiny_problem(seed=0):
+    rng = np.random.default_rng(seed)
+    weights = [rng.standard_normal((5, 6)), rng.standard_normal((4, 5)), rng.standard_normal((3, 4))]
+    biases = [rng.standard_normal(5), rng.standard_normal(4), rng.standard_normal(3)]
+    X = rng.random((7, 6))
+    labels = rng.integers(0, 3, 7)
+    return weights, biases, X, labels
+
+def loss(weights, biases, X, labels):
+    return batch_gradients(weights, biases, X, labels)[2]
+
+def test_gradients_match_finite_differences():
+    weights, biases, X, labels = tiny_problem()
+    grads_w, grads_b, _ = batch_gradients(weights, biases, X, labels)
+
+    step = 1e-6
+    for params, grads in ((weights, grads_w), (biases, grads_b)):
+        for param, grad in zip(params, grads):
+            numeric = np.empty_like(param)
+            for index in np.ndindex(param.shape):
+                original = param[index]
+                param[index] = original + step
+                upper = loss(weights, biases, X, labels)
+                param[index] = original - step
+                lower = loss(weights, biases, X, labels)
+                param[index] = original
+                numeric[index] = (upper - lower) / (2 * step)
+            np.testing.assert_allclose(grad, numeric, rtol=1e-4, atol=1e-7)
+
+def test_batch_step_lowers_the_loss(small_network):
+    rng = np.random.default_rng(1)
+    X = rng.random((16, 784), dtype=np.float32)
+    labels = rng.integers(0, 10, 16)
+
+    errors = [back_propagation_batch(X, labels, 0.1) for _ in range(20)]
+    assert errors[-1] < errors[0]
+    assert all(w.dtype == np.float32 for w in nn.weights + nn.biases)
+
+def test_batch_step_copies_read_only_weights(tmp_path, small_network):
+    path = str(tmp_path / "model.nsm")
+    nn.save_to_binary(path)
+    nn.load_from_binary(path)
+    mapped = np.array(nn.weights[0])
+
+    back_propagation_batch(np.ones((2, 784), dtype=np.float32), [1, 2], 0.1)
+    assert nn.weights[0].flags.writeable
+    assert not np.array_equal(nn.weights[0], mapped)
@@ -0,0 +1,92 @@
+
+# This file checks the binary .nsm model format: exact round trips, zero-copy loading and rejected files
+
+import random
+
+import numpy as np
+import pytest
+
+from convert import convert
+from network import NeuralNetworkStorage
+
+def make_network(*layer_sizes):
+    random.seed(1)
+    network = NeuralNetworkStorage(*layer_sizes)
+    network.to_numpy()
+    return network
+
+def assert_same_parameters(actual, expected):
+    assert tuple(actual.layer_sizes) == tuple(expected.layer_sizes)
+    for a, b in zip(actual.weights + actual.biases, expected.weights + expected.biases):
+        assert a.dtype == np.float32
+        np.testing.assert_array_equal(a, b)
+
+@pytest.mark.parametrize("layer_sizes", [(784, 16, 10), (784, 32, 24, 16, 10)])
+def test_round_trip(tmp_path, layer_sizes):
+    network = make_network(*layer_sizes)
+    path = str(tmp_path / "model.nsm")
+    network.save_to_binary(path)
+
+    loaded = NeuralNetworkStorage()
+    loaded.load(path)
+    assert_same_parameters(loaded, network)
+    assert loaded.is_numpy
+
+def test_load_is_read_only_mapping(tmp_path):
+    path = str(tmp_path / "model.nsm")
+    make_network(784, 16, 10).save_to_binary(path)
+
+    loaded = NeuralNetworkStorage()
+    loaded.load_from_binary(path)
+    assert not loaded.weights[0].flags.writeable
+    assert not loaded.weights[0].flags.owndata
+
+def test_convert_pickle(tmp_path, small_network):
+    source = str(tmp_path / "model.pickle")
+    small_network.save_to_pickle(source)
+    expected = NeuralNetworkStorage()
+    expected.load_from_pickle(source)
+    expected.to_numpy()
+
+    target = convert(source)
+    assert target == str(tmp_path / "model.nsm")
+    loaded = NeuralNetworkStorage()
+    loaded.load_from_binary(target)
+    assert_same_parameters(loaded, expected)
+
+def test_rejects_damaged_files(tmp_path):
+    path = tmp_path / "model.nsm"
+    make_network(784, 16, 10).save_to_binary(str(path))
+    data = bytearray(path.read_bytes())
+
+    flipped = bytearray(data)
+    flipped[-1] ^= 0xFF
+    (tmp_path / "flipped.nsm").write_bytes(flipped)
+    with pytest.raises(ValueError, match="Checksum"):
+        NeuralNetworkStorage().load_from_binary(str(tmp_path / "flipped.nsm"))
+    # Without verification the damaged payload is still mapped
+    NeuralNetworkStorage().load_from_binary(str(tmp_path / "flipped.nsm"), verify=False)
+
+    (tmp_path / "short.nsm").write_bytes(data[:-4])
+    with pytest.raises(ValueError, match="size"):
+        NeuralNetworkStorage().load_from_binary(str(tmp_path / "short.nsm"))
+
+    (tmp_path / "magic.nsm").write_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="not a Numscan binary model"):
+        NeuralNetworkStorage().load_from_binary(str(tmp_path / "magic.nsm"))
+
+def test_overwrite_keeps_existing_mappings(tmp_path):
+    path = str(tmp_path / "model.nsm")
+    old = make_network(784, 32, 10)
+    old.save_to_binary(path)
+    mapped = NeuralNetworkStorage()
+    mapped.load_from_binary(path)
+
+    # A smaller model replaces the file, the mapped weights still read the old one
+    make_network(784, 8, 10).save_to_binary(path)
+    assert_same_parameters(mapped, old)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model.nsm"]
+
+    loaded = NeuralNetworkStorage()
+    loaded.load_from_binary(path)
+    assert loaded.layer_sizes == (784, 8, 10)
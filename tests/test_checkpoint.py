@@ -0,0 +1,57 @@
+
+# This file checks that a training job resumed from a checkpoint ends with the same weights as an uninterrupted one
+
+import random
+
+import numpy as np
+import pytest
+
+import training
+from network import nn
+
+@pytest.fixture
+def output_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(training, "model_path", str(tmp_path / "after.pickle"))
+    monkeypatch.setattr(training, "binary_model_path", str(tmp_path / "after.nsm"))
+    return tmp_path
+
+def run_training(checkpoint, resume=False):
+    training.training(
+        epochs=2, learning_rate=0.1, batch_size=8, resume=resume,
+        checkpoint=checkpoint, checkpoint_every=2, seed=3, hidden=(16,),
+    )
+    return [np.array(w) for w in nn.weights + nn.biases]
+
+def fresh_network():
+    random.seed(0)
+    nn.reset(784, 16, 10)
+
+def test_resume_matches_uninterrupted_run(png_tree, small_network, output_paths, monkeypatch):
+    fresh_network()
+    expected = run_training(str(output_paths / "full.pickle"))
+
+    # Kill the job in the middle of the second epoch, a few batches after its last checkpoint
+    steps = []
+    step = training.back_propagation_batch
+
+    def interrupted_step(X, y, learning_rate):
+        if len(steps) == 11:
+            raise KeyboardInterrupt
+        steps.append(len(X))
+        return step(X, y, learning_rate)
+
+    checkpoint = str(output_paths / "checkpoint.pickle")
+    fresh_network()
+    monkeypatch.setattr(training, "back_propagation_batch", interrupted_step)
+    with pytest.raises(KeyboardInterrupt):
+        run_training(checkpoint)
+    monkeypatch.setattr(training, "back_propagation_batch", step)
+
+    epoch, offset, _ = training.load_checkpoint(checkpoint)
+    assert (epoch, offset) == (1, 16)
+
+    # The resumed run starts from whatever nn holds, only the checkpoint may carry the state over
+    fresh_network()
+    resumed = run_training(checkpoint, resume=True)
+    for actual, wanted in zip(resumed, expected):
+        np.testing.assert_array_equal(actual, wanted)
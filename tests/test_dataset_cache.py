@@ -0,0 +1,39 @@
+
+# This file checks the decoded dataset cache against the PNGs it was built from
+
+import os
+
+import numpy as np
+from PIL import Image
+
+import load
+
+def test_cache_matches_pngs(png_tree):
+    images, labels = load.load_dataset("train", workers=1)
+    assert images.dtype == np.uint8 and images.shape == (60, 784)
+    assert isinstance(images, np.memmap)
+
+    for row, (label, entry) in enumerate(load.list_images("train")):
+        assert labels[row] == label
+        with Image.open(entry.path) as image:
+            np.testing.assert_array_equal(images[row], np.asarray(image).reshape(-1))
+
+def test_pool_decode_matches_serial(png_tree):
+    paths = [entry.path for _, entry in load.list_images("test")]
+    np.testing.assert_array_equal(load.decode_images(paths, workers=2, chunk_size=7), load.decode_images(paths, workers=1))
+
+def test_cache_is_rebuilt_when_files_change(png_tree):
+    load.load_dataset("train", workers=1)
+
+    # Cached arrays are reused while nothing changed
+    _, meta_path = load.cache_paths("train")[1:]
+    written = os.stat(meta_path).st_mtime_ns
+    load.load_dataset("train")
+    assert os.stat(meta_path).st_mtime_ns == written
+
+    path = str(png_tree / "train" / "4" / "extra.png")
+    Image.fromarray(np.full((28, 28), 9, dtype=np.uint8)).save(path)
+    images, labels = load.load_dataset("train", workers=1)
+    assert len(images) == 61
+    row = [entry.path for _, entry in load.list_images("train")].index(path)
+    assert labels[row] == 4 and (images[row] == 9).all()
@@ -0,0 +1,59 @@
+
+# This file checks the dataset index: label ranges, random picks and rebuilds when a PNG changes
+
+import random
+
+import numpy as np
+from PIL import Image
+
+import load
+
+def test_index_matches_dataset(png_tree):
+    images, labels = load.load_dataset("train", workers=1)
+    index = load.load_index("train")
+
+    assert len(index) == len(labels)
+    np.testing.assert_array_equal(index.labels, labels)
+    np.testing.assert_array_equal(index.pixels(np.arange(len(index))), images)
+    for label in range(10):
+        rows = index.rows(label)
+        assert len(rows) == 6 and (labels[rows.start:rows.stop] == label).all()
+
+    row = index.random_row(3, random.Random(0))
+    assert index.labels[row] == 3
+    with Image.open(index.path(row)) as image:
+        np.testing.assert_array_equal(index.pixels(row), np.asarray(image).reshape(-1))
+
+    rows = index.sample(4, label=7, rng=np.random.default_rng(0))
+    assert list(rows) == sorted(set(rows)) and (index.labels[rows] == 7).all()
+
+def test_index_is_rebuilt_when_a_png_is_rewritten(png_tree):
+    index = load.load_index("train", workers=1)
+    row = index.rows(5)[2]
+
+    # Rewriting a file in place leaves the mtime of its class directory alone, only a full check notices it
+    Image.fromarray(np.full((28, 28), 200, dtype=np.uint8)).save(index.path(row))
+    assert load.load_index("train") is index
+    index = load.load_index("train", workers=1, refresh=True)
+    assert (index.pixels(row) == 200).all()
+
+def test_loaded_index_follows_added_files_and_rebuilt_caches(png_tree):
+    index = load.load_index("train", workers=1)
+    Image.fromarray(np.zeros((28, 28), dtype=np.uint8)).save(png_tree / "train" / "2" / "extra.png")
+    index = load.load_index("train", workers=1)
+    assert len(index.rows(2)) == 7
+
+    # Another process rebuilds the cache after a rewrite, the loaded index follows its fingerprint
+    row = index.rows(8)[0]
+    Image.fromarray(np.full((28, 28), 77, dtype=np.uint8)).save(index.path(row))
+    load.load_dataset("train", workers=1)
+    assert (load.load_index("train").pixels(row) == 77).all()
+
+def test_index_is_listed_once_per_process(png_tree, monkeypatch):
+    calls = []
+    list_images = load.list_images
+    monkeypatch.setattr(load, "list_images", lambda split: calls.append(split) or list_images(split))
+
+    index = load.load_index("test", workers=1)
+    assert load.load_index("test") is load.load_index("test") is index
+    assert calls == ["test"]
@@ -0,0 +1,71 @@
+
+# This file checks the NumPy CNN engine against direct-loop versions of the Keras layers, without Tensorflow
+
+import os
+
+import numpy as np
+import pytest
+
+from engine import (
+    MODEL_PATH,
+    WEIGHT_SHAPES,
+    CnnEngine,
+    check_parity,
+    check_reference,
+    conv2d,
+    max_pool,
+    reference_conv2d,
+    reference_flatten,
+    reference_forward,
+    reference_max_pool,
+)
+
+def random_weights(seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.standard_normal(shape).astype(np.float32) * 0.1 for shape in WEIGHT_SHAPES]
+
+def test_layers_match_reference():
+    rng = np.random.default_rng(1)
+    x = rng.random((2, 9, 8, 3), dtype=np.float32)
+    kernel = rng.standard_normal((3, 3, 3, 4)).astype(np.float32)
+    bias = rng.standard_normal(4).astype(np.float32)
+
+    np.testing.assert_allclose(conv2d(x, kernel, bias), reference_conv2d(x, kernel, bias), rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(max_pool(x), reference_max_pool(x))
+    np.testing.assert_array_equal(x.reshape(len(x), -1), reference_flatten(x))
+
+def test_forward_matches_reference():
+    assert check_reference(random_weights(), samples=1) < 1e-5
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="no saved Numscan 2 model")
+def test_saved_model_matches_reference():
+    assert check_reference(CnnEngine.load(MODEL_PATH).weights, samples=1) < 1e-5
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="no saved Numscan 2 model")
+def test_saved_model_matches_keras():
+    pytest.importorskip("tensorflow")
+    difference, agreement = check_parity(MODEL_PATH, samples=64)
+    assert difference < 1e-4
+    assert agreement == 1.0
+
+def test_reference_catches_a_wrong_kernel_layout():
+    weights = random_weights()
+    x = np.random.default_rng(0).random((1, 28, 28, 1), dtype=np.float32)
+    expected = reference_forward(weights, x)
+
+    weights[2] = np.ascontiguousarray(weights[2].transpose(1, 0, 2, 3))
+    assert np.abs(CnnEngine(weights).predict(x) - expected).max() > 1e-4
+
+def test_predict_in_batches():
+    engine = CnnEngine(random_weights())
+    x = np.random.default_rng(2).random((5, 784), dtype=np.float32)
+    probabilities = engine.predict(x, batch_size=2)
+    assert probabilities.shape == (5, 10)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, rtol=1e-5)
+    np.testing.assert_allclose(probabilities, engine.predict(x), rtol=1e-5, atol=1e-7)
+
+def test_rejects_other_architectures():
+    weights = random_weights()
+    weights[4] = weights[4][:100]
+    with pytest.raises(ValueError):
+        CnnEngine(weights)
@@ -0,0 +1,38 @@
+
+# This file checks that incremental first-layer updates give the same result as a full forward pass
+
+import numpy as np
+import pytest
+
+from network import nn
+from predict import IncrementalExec, exec
+
+def strokes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    canvas = np.zeros(784, dtype=np.float32)
+    for _ in range(count):
+        canvas = canvas.copy()
+        canvas[rng.integers(0, 784, 12)] = rng.random(12, dtype=np.float32)
+        yield canvas
+
+@pytest.mark.parametrize("storage", ["lists", "numpy"])
+def test_matches_full_exec_while_drawing(small_network, storage):
+    if storage == "lists":
+        nn.to_lists()
+    incremental = IncrementalExec(refresh_every=7)
+
+    for canvas in strokes(20):
+        xs, zs = incremental.exec(canvas)
+        full_xs, full_zs = exec(canvas if storage == "numpy" else canvas.tolist())
+        assert len(zs) == len(full_zs)
+        for actual, expected in zip(xs + zs, full_xs + full_zs):
+            np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+    assert incremental.updates < 7
+
+def test_notices_a_new_model(small_network):
+    incremental = IncrementalExec()
+    canvas = next(strokes(1))
+    incremental.exec(canvas)
+
+    nn.weights = [w * 2 for w in nn.weights]
+    np.testing.assert_allclose(incremental.exec(canvas)[1][-1], exec(canvas)[1][-1], rtol=1e-5, atol=1e-6)
@@ -0,0 +1,37 @@
+
+# This file checks that serving picks the newer of the pickle and binary Numscan models
+
+import os
+
+import pytest
+
+import Numscan.Scripts.serving as serving
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    models = tmp_path / "Models"
+    models.mkdir()
+    monkeypatch.setattr(serving, "NUMSCAN_DIR", str(tmp_path))
+    return models
+
+def touch(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+@pytest.mark.parametrize("newest", ["after.pickle", "after.nsm"])
+def test_newest_model_comes_first(models_dir, small_network, newest):
+    small_network.save_to_pickle(str(models_dir / "after.pickle"))
+    small_network.save_to_binary(str(models_dir / "after.nsm"))
+    for name in ("after.pickle", "after.nsm"):
+        touch(models_dir / name, 2_000_000_000 if name == newest else 1_000_000_000)
+
+    candidates = serving.numscan_model_candidates()
+    assert [os.path.basename(path) for path in candidates][0] == newest
+    assert serving.resolve_model_path(candidates) == str(models_dir / newest)
+
+def test_missing_files_are_skipped(models_dir, small_network):
+    small_network.save_to_pickle(str(models_dir / "after.pickle"))
+    assert serving.resolve_model_path(serving.numscan_model_candidates()) == str(models_dir / "after.pickle")
+
+    os.remove(models_dir / "after.pickle")
+    with pytest.raises(FileNotFoundError):
+        serving.resolve_model_path(serving.numscan_model_candidates())
@@ -0,0 +1,77 @@
+
+# This file checks the data-parallel trainer against serial training on the same batches
+
+import numpy as np
+import pytest
+
+from load import iter_batches, load_dataset
+from parallel import ParallelTrainer
+from network import nn
+from train import batch_gradients
+import training
+
+def parameters():
+    return [np.array(w) for w in nn.weights + nn.biases]
+
+def serial_step(weights, biases, images, labels, batch, learning_rate):
+    X, y = next(iter_batches(images, labels, len(batch), batch))
+    grads_w, grads_b, error = batch_gradients(weights, biases, X, y)
+    for layer in range(len(grads_w)):
+        weights[layer] -= learning_rate * grads_w[layer]
+        biases[layer] -= learning_rate * grads_b[layer]
+    return error
+
+@pytest.fixture
+def trainer(png_tree, small_network, request):
+    # Like training.py, the cache is built before the workers start
+    load_dataset("train")
+    trainer = ParallelTrainer(3, request.param)
+    yield trainer
+    trainer.close()
+
+@pytest.mark.parametrize("trainer", ["sync"], indirect=True)
+def test_sync_step_matches_serial_gradients(trainer):
+    images, labels = load_dataset("train")
+    start = parameters()
+    weights, biases = start[:nn.num_layers - 1], start[nn.num_layers - 1:]
+
+    # A batch that does not split evenly over the three workers
+    for batch in np.random.default_rng(0).permutation(len(images))[:32].reshape(4, 8)[:, :7]:
+        expected = serial_step(weights, biases, images, labels, batch, 0.1)
+        error = trainer.sync_step(batch, 0.1)
+        assert error == pytest.approx(expected, rel=1e-5)
+
+    for actual, wanted in zip(parameters(), weights + biases):
+        np.testing.assert_allclose(actual, wanted, rtol=1e-5, atol=1e-6)
+    assert any(not np.array_equal(a, b) for a, b in zip(parameters(), start))
+
+@pytest.mark.parametrize("trainer", ["sync"], indirect=True)
+def test_sync_epoch_matches_serial_epoch(trainer):
+    images, labels = load_dataset("train")
+    order = np.random.default_rng(1).permutation(len(images))
+    start = parameters()
+
+    steps = []
+    errors = trainer.run_epoch(order, 8, 8, 0.1, lambda step, done, error: steps.append(done))
+    parallel = parameters()
+    assert steps[-1] == len(images) and len(errors) == len(steps)
+
+    for array, value in zip(nn.weights + nn.biases, start):
+        array[...] = value
+    serial_errors = training.run_epoch(images, labels, order, 8, 8, 0.1)
+    np.testing.assert_allclose(errors, serial_errors, rtol=1e-5)
+    for actual, wanted in zip(parameters(), parallel):
+        np.testing.assert_allclose(actual, wanted, rtol=1e-5, atol=1e-6)
+
+@pytest.mark.parametrize("trainer", ["hogwild"], indirect=True)
+def test_hogwild_epoch_reports_progress(trainer):
+    images, _ = load_dataset("train")
+    order = np.random.default_rng(2).permutation(len(images))
+    start = parameters()
+
+    done = []
+    errors = trainer.run_epoch(order, 0, 2, 0.1, lambda step, samples, error: done.append(samples))
+    # 20 samples per worker in batches of 2 is one progress message per worker
+    assert len(errors) == len(images) // 2
+    assert done == sorted(done) and done[-1] == len(images)
+    assert any(not np.array_equal(a, b) for a, b in zip(parameters(), start))
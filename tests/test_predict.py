@@ -0,0 +1,31 @@
+
+# This file checks the batched forward pass against the per-sample one, for list and ndarray storage
+
+import numpy as np
+import pytest
+
+from network import nn
+from predict import exec, feed_forward, predict_batch, soft_max
+
+def inputs(count, seed=0):
+    return np.random.default_rng(seed).random((count, 784), dtype=np.float32)
+
+@pytest.mark.parametrize("storage", ["lists", "numpy"])
+def test_batch_matches_single_samples(small_network, storage):
+    if storage == "lists":
+        nn.to_lists()
+    X = inputs(6)
+    logits, probs, labels = predict_batch(X)
+
+    for i, x in enumerate(X):
+        single = np.asarray(exec(x if storage == "numpy" else x.tolist())[1][-1])
+        np.testing.assert_allclose(logits[i], single, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(probs[i], soft_max(single), rtol=1e-4, atol=1e-6)
+        assert labels[i] == feed_forward(x if storage == "numpy" else x.tolist())
+
+def test_chunks_and_input_shapes(small_network):
+    X = inputs(10)
+    logits = predict_batch(X)[0]
+    np.testing.assert_allclose(predict_batch(X, chunk_size=3)[0], logits, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(predict_batch(X.reshape(10, 28, 28).tolist())[0], logits, rtol=1e-5, atol=1e-6)
+    assert predict_batch(np.empty((0, 784), dtype=np.float32))[0].shape == (0, 10)
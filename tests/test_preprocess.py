@@ -0,0 +1,47 @@
+
+# This file checks the shared image preprocessing: batch conversion and the MNIST-style normalization
+
+import numpy as np
+from PIL import Image
+
+from preprocess import GRID_SIZE, image_to_pixels, image_to_vector, images_to_uint8, images_to_vectors, mnist_normalize
+
+def sample_images(seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        Image.fromarray(rng.integers(0, 256, (28, 28), dtype=np.uint8)),
+        Image.fromarray(rng.integers(0, 256, (40, 33, 3), dtype=np.uint8)),
+        Image.fromarray(rng.integers(0, 256, (28, 28, 4), dtype=np.uint8), "RGBA"),
+        Image.fromarray(rng.integers(0, 256, (12, 50), dtype=np.uint8)),
+    ]
+
+def test_batch_matches_single_images():
+    images = sample_images()
+    for normalize in (False, True):
+        batch = images_to_uint8(images, normalize)
+        assert batch.dtype == np.uint8 and batch.shape == (len(images), 784)
+        for row, image in zip(batch, images):
+            np.testing.assert_array_equal(row, image_to_pixels(image, normalize).reshape(-1))
+        assert images_to_uint8([], normalize).shape == (0, 784)
+
+def test_vectors_are_scaled_pixels():
+    images = sample_images()
+    vectors = images_to_vectors(images)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors * 255, images_to_uint8(images), atol=1e-4)
+    np.testing.assert_array_equal(image_to_vector(images[1]), vectors[1])
+
+def test_normalize_fits_and_centers_the_digit():
+    pixels = np.zeros((100, 80), dtype=np.uint8)
+    pixels[5:65, 50:70] = 255
+    result = mnist_normalize(pixels)
+
+    rows = np.flatnonzero(result.max(axis=1))
+    cols = np.flatnonzero(result.max(axis=0))
+    assert max(len(rows), len(cols)) <= 20
+    weights = result.astype(np.float64)
+    middle = (GRID_SIZE - 1) / 2
+    assert abs((weights.sum(axis=1) * np.arange(GRID_SIZE)).sum() / weights.sum() - middle) <= 1
+    assert abs((weights.sum(axis=0) * np.arange(GRID_SIZE)).sum() / weights.sum() - middle) <= 1
+
+    assert not mnist_normalize(np.zeros((30, 30), dtype=np.uint8)).any()
@@ -0,0 +1,55 @@
+
+# This file checks the int8 quantization against the float32 network it was made from
+
+import numpy as np
+
+from predict import exec, exec_int8, int_mm, predict_batch, predict_batch_int8
+from quantize import QuantizedNetwork, quantize, quantize_matrix
+
+def inputs(count, seed=0):
+    return np.random.default_rng(seed).random((count, 784), dtype=np.float32)
+
+def test_quantize_matrix_error_within_half_a_step():
+    matrix = np.random.default_rng(1).standard_normal((8, 50)).astype(np.float32)
+    matrix[3] = 0
+    quantized, scales = quantize_matrix(matrix)
+    assert quantized.dtype == np.int8 and np.abs(quantized).max() <= 127
+    assert scales[3] == 1.0
+    assert (np.abs(quantized * scales[:, None] - matrix) <= scales[:, None] / 2 + 1e-7).all()
+
+def test_int_mm_paths_agree():
+    rng = np.random.default_rng(2)
+    a_q = rng.integers(-127, 128, (5, 300)).astype(np.float32)
+    w_q = rng.integers(-127, 128, (7, 300)).astype(np.int8)
+    expected = a_q.astype(np.int64) @ w_q.T.astype(np.int64)
+    np.testing.assert_array_equal(int_mm(a_q, w_q), expected)
+
+def test_int8_agrees_with_float32(small_network):
+    X = inputs(500)
+    logits, _, labels = predict_batch(X)
+
+    for qnet in (quantize(small_network), quantize(small_network, inputs(100, seed=1))):
+        q_logits, _, q_labels = predict_batch_int8(qnet, X, chunk_size=128)
+        assert (q_labels == labels).mean() >= 0.95
+        assert np.abs(q_logits - logits).mean() <= 0.05 * np.abs(logits).mean()
+
+def test_single_sample_matches_batch(small_network):
+    qnet = quantize(small_network)
+    X = inputs(3)
+    xs, zs = exec_int8(qnet, X[1])
+    np.testing.assert_allclose(zs[-1], predict_batch_int8(qnet, X[1:2])[0][0], rtol=1e-5, atol=1e-6)
+    assert len(xs) == len(exec(X[1])[0])
+
+def test_save_and_load(tmp_path, small_network):
+    qnet = quantize(small_network, inputs(50))
+    path = str(tmp_path / "model-int8.npz")
+    qnet.save(path)
+    loaded = QuantizedNetwork.load(path)
+
+    assert loaded.layer_sizes == qnet.layer_sizes
+    # Scales are stored as float32
+    np.testing.assert_allclose(loaded.input_scales, qnet.input_scales, rtol=1e-6)
+    for a, b in zip(loaded.weights + loaded.scales + loaded.biases, qnet.weights + qnet.scales + qnet.biases):
+        np.testing.assert_array_equal(a, b)
+    X = inputs(20)
+    np.testing.assert_array_equal(predict_batch_int8(loaded, X)[2], predict_batch_int8(qnet, X)[2])
@@ -0,0 +1,106 @@
+
+# This file checks publishing models into shared memory and the seqlock readers use to pick them up
+
+import multiprocessing as mp
+import random
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from network import NeuralNetworkStorage
+from shared_model import SharedModelPublisher, SharedModelReader
+
+def make_network(seed, *layer_sizes):
+    random.seed(seed)
+    network = NeuralNetworkStorage(*layer_sizes)
+    network.to_numpy()
+    return network
+
+def assert_same_parameters(actual, expected):
+    assert tuple(actual.layer_sizes) == tuple(expected.layer_sizes)
+    for a, b in zip(actual.weights + actual.biases, expected.weights + expected.biases):
+        np.testing.assert_array_equal(a, b)
+
+@pytest.fixture
+def publisher():
+    publisher = SharedModelPublisher()
+    yield publisher
+    publisher.close()
+
+def test_refresh_follows_published_versions(publisher):
+    first = make_network(0, 784, 16, 10)
+    second = make_network(1, 784, 24, 12, 10)
+    reader = SharedModelReader(publisher.name)
+    network = NeuralNetworkStorage()
+    try:
+        assert publisher.publish(first) == 1
+        assert reader.refresh(network)
+        assert_same_parameters(network, first)
+        assert not network.weights[0].flags.writeable
+        assert not reader.refresh(network)
+
+        # The arrays of the first version are still in use while the second one is bound
+        old_weights = network.weights[0]
+        assert publisher.publish(second) == 2
+        assert reader.refresh(network)
+        assert reader.version == 2
+        assert_same_parameters(network, second)
+        np.testing.assert_array_equal(old_weights, first.weights[0])
+        assert len(reader.retired) == 1
+
+        del old_weights
+        reader._close_retired()
+        assert not reader.retired
+    finally:
+        del network
+        reader.close()
+
+def test_reader_waits_while_a_publish_is_in_progress(publisher):
+    publisher.publish(make_network(0, 784, 16, 10))
+    reader = SharedModelReader(publisher.name)
+    try:
+        # An odd sequence marks a half-written control block
+        sequence = struct.unpack_from("<Q", publisher.control.buf, 0)[0]
+        struct.pack_into("<Q", publisher.control.buf, 0, sequence + 1)
+        struct.pack_into("<Q64s", publisher.control.buf, 8, 7, b"half-written")
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(reader.current()), daemon=True)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive() and not result
+
+        struct.pack_into("<Q64s", publisher.control.buf, 8, 7, b"complete")
+        struct.pack_into("<Q", publisher.control.buf, 0, sequence + 2)
+        thread.join(5)
+        assert result == [(7, "complete")]
+    finally:
+        reader.close()
+
+def forward(network, X):
+    for w, b in zip(network.weights, network.biases):
+        X = np.maximum(X @ w.T + b, 0)
+    return X
+
+def read_in_worker(control_name, X):
+    network = NeuralNetworkStorage()
+    reader = SharedModelReader(control_name)
+    reader.refresh(network)
+    output = forward(network, X)
+    del network
+    reader.close()
+    return reader.version, output
+
+def test_worker_processes_see_the_published_model(publisher):
+    network = make_network(2, 784, 16, 10)
+    publisher.publish(network)
+    X = np.random.default_rng(0).random((4, 784), dtype=np.float32)
+    expected = forward(network, X)
+
+    with mp.get_context("spawn").Pool(2) as pool:
+        results = pool.starmap(read_in_worker, [(publisher.name, X)] * 2)
+    for version, output in results:
+        assert version == 1
+        np.testing.assert_array_equal(output, expected)
@@ -0,0 +1,35 @@
+
+# This file checks the training metrics file and the per-layer timers
+
+import json
+from collections import defaultdict
+
+import telemetry
+import training
+from predict import exec
+
+def test_profiled_training_writes_timers(png_tree, small_network, tmp_path, monkeypatch):
+    monkeypatch.setattr(training, "model_path", str(tmp_path / "after.pickle"))
+    monkeypatch.setattr(training, "binary_model_path", str(tmp_path / "after.nsm"))
+    metrics = tmp_path / "metrics.jsonl"
+    training.training(epochs=1, batch_size=16, checkpoint=str(tmp_path / "checkpoint.pickle"),
+                      seed=0, profile=True, metrics=str(metrics))
+
+    records = [json.loads(line) for line in metrics.read_text().splitlines()]
+    kinds = [record["kind"] for record in records]
+    assert kinds[-1] == "timers" and "epoch" in kinds and "progress" in kinds
+    assert "backprop_batch.forward" in records[-1]["timers"]
+    assert not telemetry.enabled and telemetry.writer is None
+
+def test_layer_timers_only_while_enabled(small_network, monkeypatch):
+    monkeypatch.setattr(telemetry, "totals", defaultdict(float))
+    monkeypatch.setattr(telemetry, "counts", defaultdict(int))
+    exec([0.5] * 784)
+    assert not telemetry.totals
+
+    telemetry.enable()
+    try:
+        exec([0.5] * 784)
+    finally:
+        telemetry.disable()
+    assert sorted(telemetry.totals) == ["exec.layer0", "exec.layer1", "exec.layer2"]